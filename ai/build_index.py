@@ -1,57 +1,163 @@
+import os
 import json
+import shutil
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
 import faiss
 from ai.config import (
-    OUTPUT_DIR, CHUNK_JSONL, METADATA_CSV,
-    EMBED_MODEL, FAISS_INDEX_PATH, EMBEDDINGS_NPY
+    OUTPUT_DIR, CHUNKS_FILE, META_FILE, INDEX_FILE, EMBEDDINGS_FILE,
+    EMBED_BACKEND, NUM_INDEX_SHARDS, SHARD_MANIFEST_FILE,
+    DEDUP_ENABLED, DUPLICATES_FILE, DEDUP_REPORT_FILE
 )
+from ai.sharded_index import shard_dir, shard_path
+from ai.dedup import find_near_duplicates, dedup_report
+from ai.encoders import get_encoder, write_encoder_info
 
 
-def load_chunks():
+def load_chunks(artifact_dir=OUTPUT_DIR):
     chunks = []
-    with open(CHUNK_JSONL, "r", encoding="utf-8") as f:
+    with open(os.path.join(artifact_dir, CHUNKS_FILE), "r", encoding="utf-8") as f:
         for line in f:
             chunks.append(json.loads(line))
     return chunks
 
 
-def build_index():
+def partition_by_document(chunks, num_shards):
+    """
+    Assign whole documents to shards, balancing chunk counts.
+    Returns one list of chunk positions per shard.
+    """
+    by_doc = {}
+    for i, c in enumerate(chunks):
+        by_doc.setdefault(c["doc_id"], []).append(i)
+
+    shards = [[] for _ in range(num_shards)]
+    # Largest documents first, each into the currently smallest shard
+    for doc_id in sorted(by_doc, key=lambda d: (-len(by_doc[d]), d)):
+        target = min(range(num_shards), key=lambda s: len(shards[s]))
+        shards[target].extend(by_doc[doc_id])
+    return [sorted(s) for s in shards]
+
+
+def collapse_duplicates(chunks, out_dir=OUTPUT_DIR):
+    """
+    Keep one representative per near-duplicate cluster. Each representative
+    carries the chunk records of every copy under "members" so search can
+    expand a hit to all documents containing that clause.
+    """
+    reps, members = find_near_duplicates(chunks)
+    report = dedup_report(chunks, reps, members)
+    with open(os.path.join(out_dir, DEDUP_REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"🧹 Near-duplicates: {report['chunks']} chunks -> {report['representatives']} "
+          f"representatives ({report['shrink_ratio']:.1%} smaller index)")
+
+    kept = []
+    for i in reps:
+        rep = dict(chunks[i])
+        if len(members[i]) > 1:
+            rep["members"] = [
+                {k: chunks[m][k] for k in ("chunk_id", "doc_id", "start", "end")}
+                for m in members[i]
+            ]
+        kept.append(rep)
+    return kept
+
+
+def write_duplicates(chunks, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for c in chunks:
+            if "members" in c:
+                f.write(json.dumps({"chunk_id": c["chunk_id"], "members": c["members"]}) + "\n")
+
+
+def write_shards(chunks, embeddings, num_shards, out_dir=OUTPUT_DIR):
+    base = shard_dir(out_dir)
+    if os.path.exists(base):
+        shutil.rmtree(base)
+    os.makedirs(base)
+
+    manifest = {"num_shards": num_shards, "dim": int(embeddings.shape[1]), "shards": []}
+    for shard_id, rows in enumerate(partition_by_document(chunks, num_shards)):
+        path = shard_path(shard_id, out_dir)
+        os.makedirs(path)
+
+        index = faiss.IndexFlatIP(embeddings.shape[1])
+        if rows:
+            index.add(embeddings[rows].astype("float32"))
+        faiss.write_index(index, os.path.join(path, INDEX_FILE))
+
+        shard_chunks = [chunks[i] for i in rows]
+        pd.DataFrame(
+            [{k: c[k] for k in ("chunk_id", "doc_id", "start", "end")} for c in shard_chunks],
+            columns=["chunk_id", "doc_id", "start", "end"],
+        ).to_csv(os.path.join(path, META_FILE), index=False)
+        with open(os.path.join(path, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            for c in shard_chunks:
+                f.write(json.dumps({k: v for k, v in c.items() if k != "members"}) + "\n")
+        write_duplicates(shard_chunks, os.path.join(path, DUPLICATES_FILE))
+
+        manifest["shards"].append({
+            "path": os.path.basename(path),
+            "chunks": len(rows),
+            "docs": len({c["doc_id"] for c in shard_chunks}),
+        })
+        print(f"🧩 Shard {shard_id}: {len(rows)} chunks")
+
+    with open(os.path.join(base, SHARD_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def build_index(num_shards=NUM_INDEX_SHARDS, out_dir=OUTPUT_DIR, dedup=DEDUP_ENABLED,
+                backend=EMBED_BACKEND):
     print("📥 Loading chunks...")
-    chunks = load_chunks()
+    chunks = load_chunks(out_dir)
+    if dedup:
+        chunks = collapse_duplicates(chunks, out_dir)
     texts = [c["text"] for c in chunks]
 
     print(f"Total chunks: {len(texts)}")
-    print("🔍 Generating embeddings using:", EMBED_MODEL)
+    encoder = get_encoder(backend)
+    print(f"🔍 Generating embeddings using: {encoder.model_name} ({encoder.name})")
+
+    # Encoders return L2-normalized vectors (important for cosine similarity)
+    embeddings = encoder.encode(texts, batch_size=16, show_progress_bar=True)
+    write_encoder_info(encoder, out_dir)
 
-    model = SentenceTransformer(EMBED_MODEL)
+    embeddings_npy = os.path.join(out_dir, EMBEDDINGS_FILE)
+    print("💾 Saving embeddings to:", embeddings_npy)
+    np.save(embeddings_npy, embeddings)
 
-    embeddings = model.encode(
-        texts,
-        show_progress_bar=True,
-        convert_to_numpy=True,
-        batch_size=16,
-    )
+    if num_shards > 1:
+        print(f"💾 Writing {num_shards} FAISS shards to:", shard_dir(out_dir))
+        write_shards(chunks, embeddings, num_shards, out_dir)
+        print("🚀 Index build complete!")
+        return
 
-    # Normalize embeddings (important for cosine similarity)
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    embeddings = embeddings / (norms + 1e-10)
+    # Single index; drop any old shard set so the retriever does not pick it up
+    if os.path.exists(shard_dir(out_dir)):
+        shutil.rmtree(shard_dir(out_dir))
 
-    print("💾 Saving embeddings to:", EMBEDDINGS_NPY)
-    np.save(EMBEDDINGS_NPY, embeddings)
+    # Index rows are the representatives; metadata must line up with them
+    pd.DataFrame(
+        [{k: c[k] for k in ("chunk_id", "doc_id", "start", "end")} for c in chunks],
+        columns=["chunk_id", "doc_id", "start", "end"],
+    ).to_csv(os.path.join(out_dir, META_FILE), index=False)
+    write_duplicates(chunks, os.path.join(out_dir, DUPLICATES_FILE))
 
     # FAISS index
     d = embeddings.shape[1]
     index = faiss.IndexFlatIP(d)
     index.add(embeddings.astype("float32"))
 
-    print("💾 Saving FAISS index to:", FAISS_INDEX_PATH)
-    faiss.write_index(index, FAISS_INDEX_PATH)
+    faiss_index_path = os.path.join(out_dir, INDEX_FILE)
+    print("💾 Saving FAISS index to:", faiss_index_path)
+    faiss.write_index(index, faiss_index_path)
 
     print("🚀 Index build complete!")
 
 
 if __name__ == "__main__":
-    build_index()
+    import sys
+    build_index(int(sys.argv[1]) if len(sys.argv) > 1 else NUM_INDEX_SHARDS)
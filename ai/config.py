@@ -3,9 +3,10 @@ import os
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 DATA_DIR = os.path.join(BASE_DIR, "data", "CUAD_v1")
-TXT_DIR = os.path.join(DATA_DIR, "full_contract_txt")
 
-OUTPUT_DIR = os.path.join(BASE_DIR, "outputs")
+# Environment overrides let tools (e.g. api/loadtest.py) run against a scratch tree
+TXT_DIR = os.environ.get("LEGALLENS_TXT_DIR", os.path.join(DATA_DIR, "full_contract_txt"))
+OUTPUT_DIR = os.environ.get("LEGALLENS_OUTPUT_DIR", os.path.join(BASE_DIR, "outputs"))
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(TXT_DIR, exist_ok=True)
 
@@ -14,7 +15,73 @@ CHUNK_OVERLAP = 300     # characters
 
 EMBED_MODEL = "sentence-transformers/all-mpnet-base-v2"
 
-FAISS_INDEX_PATH = os.path.join(OUTPUT_DIR, "faiss.index")
-EMBEDDINGS_NPY = os.path.join(OUTPUT_DIR, "embeddings.npy")
-CHUNK_JSONL = os.path.join(OUTPUT_DIR, "chunks.jsonl")
-METADATA_CSV = os.path.join(OUTPUT_DIR, "metadata.csv")
+# Embedding backend (see ai/encoders.py)
+EMBED_BACKEND = os.environ.get("LEGALLENS_EMBED_BACKEND", "sentence-transformers")  # or "onnx", "hashing"
+ENCODER_THREADS = 0                        # intra-op threads; 0 keeps the library default
+ENCODER_INFO_FILE = "encoder.json"         # which backend built an index
+ONNX_MODEL_DIR = os.path.join(OUTPUT_DIR, "onnx")
+ONNX_QUANTIZE = True                       # dynamic int8 weights
+ONNX_MAX_LENGTH = 384                      # tokens; matches all-mpnet-base-v2
+HASHING_DIM = 768                          # deterministic local stand-in encoder
+
+# Artifact file names; the same layout is used in OUTPUT_DIR and in each version directory
+INDEX_FILE = "faiss.index"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+META_FILE = "metadata.csv"
+
+FAISS_INDEX_PATH = os.path.join(OUTPUT_DIR, INDEX_FILE)
+EMBEDDINGS_NPY = os.path.join(OUTPUT_DIR, EMBEDDINGS_FILE)
+CHUNK_JSONL = os.path.join(OUTPUT_DIR, CHUNKS_FILE)
+METADATA_CSV = os.path.join(OUTPUT_DIR, META_FILE)
+
+# Document store (compressed, sharded segment files replacing loose TXT files)
+DOCSTORE_DIR = os.path.join(OUTPUT_DIR, "docstore")
+DOCSTORE_SHARDS = 16
+DOCSTORE_BLOCK_CHARS = 64 * 1024          # characters per compressed block
+DOCSTORE_SEGMENT_BYTES = 256 * 1024 * 1024  # roll over to a new segment file
+DOCSTORE_CACHE_DOCS = 256                 # decoded documents kept in memory
+
+# Sharded FAISS index
+NUM_INDEX_SHARDS = 1                       # 1 keeps the single faiss.index layout
+SHARD_SUBDIR = "shards"                    # inside an artifact directory
+SHARD_MANIFEST_FILE = "shards.json"
+SHARD_BACKEND = "thread"                   # "thread", "process" or "remote"
+SHARD_SERVERS = []                         # ["127.0.0.1:7100", ...] for the remote backend
+SHARD_AUTHKEY = os.environ.get("LEGALLENS_SHARD_AUTHKEY", "").encode()  # required by the remote backend
+SHARD_TIMEOUT_S = 2.0                      # per-query budget before a shard is skipped
+SHARD_MAX_FAILURES = 3                     # consecutive failures before a shard is backed off
+SHARD_RETRY_S = 30.0                       # longest back-off between probes of a failed shard
+SHARD_MAX_INFLIGHT = 4                     # concurrent requests per shard
+
+# Versioned artifacts and retriever hot-swap
+VERSIONS_DIR = os.path.join(OUTPUT_DIR, "versions")
+CURRENT_VERSION_FILE = os.path.join(OUTPUT_DIR, "CURRENT")   # name of the live version
+VERSIONS_KEEP = 3                          # published versions kept on disk
+VERSION_POLL_S = 15.0                      # how often the API checks CURRENT
+VERSION_RETRY_MAX_S = 600.0                # longest wait before retrying a version that failed to load
+
+# Background answers for suggested questions
+PRECOMPUTE_WORKERS = 1                     # low-priority threads answering suggestions
+PRECOMPUTE_CACHE_DOCS = 1024               # documents whose answers stay in memory
+PRECOMPUTE_MISS_TTL_S = 5.0                # how long "no answers yet" is trusted (other workers may save them)
+PRECOMPUTE_NICE = 10                       # niceness added to worker threads (Linux)
+
+# Admission control for model-bound endpoints
+SCHED_LIMITS = {
+    # resource: concurrent holders, max queued requests
+    "encoder": {"concurrency": 2, "max_queue": 32},
+    "pdf": {"concurrency": 2, "max_queue": 8},
+    "io": {"concurrency": 8, "max_queue": 64},
+}
+SCHED_DEADLINE_S = {"interactive": 5.0, "bulk": 30.0}   # max time a request may queue
+SCHED_BULK_QUEUE_SHARE = 0.5               # bulk requests may fill at most this share of a queue
+
+# Near-duplicate chunk collapsing at index-build time (MinHash + LSH)
+DEDUP_ENABLED = True
+DEDUP_SHINGLE = 5                          # words per shingle
+DEDUP_NUM_PERM = 128                       # MinHash permutations
+DEDUP_BANDS = 16                           # LSH bands (DEDUP_NUM_PERM / bands rows each)
+DEDUP_THRESHOLD = 0.8                      # estimated Jaccard needed to collapse two chunks
+DUPLICATES_FILE = "duplicates.jsonl"
+DEDUP_REPORT_FILE = "dedup_report.json"
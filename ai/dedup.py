@@ -0,0 +1,106 @@
+import re
+import zlib
+import numpy as np
+from tqdm import tqdm
+from ai.config import (
+    DEDUP_SHINGLE, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_THRESHOLD
+)
+
+_PRIME = (1 << 31) - 1   # keeps a * x + b inside uint64 for 32-bit shingle hashes
+
+
+class MinHasher:
+
+    def __init__(self, num_perm=DEDUP_NUM_PERM, shingle=DEDUP_SHINGLE, seed=1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)
+        self.shingle = shingle
+
+    def shingles(self, text):
+        words = re.findall(r"\w+", text.lower())
+        if not words:
+            return None
+        k = min(self.shingle, len(words))
+        grams = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams),
+                           dtype=np.uint64, count=len(grams))
+
+    def signature(self, text):
+        x = self.shingles(text)
+        if x is None:
+            return None
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) % _PRIME).min(axis=1)
+
+
+def find_near_duplicates(chunks, threshold=DEDUP_THRESHOLD, bands=DEDUP_BANDS,
+                         num_perm=DEDUP_NUM_PERM):
+    """
+    Group near-identical chunks (boilerplate clauses repeated across contracts).
+
+    Chunks are visited in order; each one joins the most similar earlier
+    representative sharing an LSH bucket if their estimated Jaccard
+    similarity reaches `threshold`, otherwise it becomes a representative.
+    Comparing against representatives (not arbitrary members) stops chains
+    of slightly different copies from drifting apart.
+
+    Returns (representative positions, {rep position: [member positions]}).
+    """
+    hasher = MinHasher(num_perm)
+    rows = num_perm // bands
+    buckets = [{} for _ in range(bands)]
+    signatures = {}
+    reps = []
+    members = {}
+
+    for i, c in enumerate(tqdm(chunks, desc="MinHash dedup")):
+        sig = hasher.signature(c["text"])
+        if sig is None:
+            reps.append(i)
+            members[i] = [i]
+            continue
+
+        keys = [sig[b * rows:(b + 1) * rows].tobytes() for b in range(bands)]
+        candidates = set()
+        for b, key in enumerate(keys):
+            candidates.update(buckets[b].get(key, ()))
+
+        best, best_sim = None, threshold
+        for r in candidates:
+            sim = float(np.mean(signatures[r] == sig))
+            if sim >= best_sim:
+                best, best_sim = r, sim
+
+        if best is not None:
+            members[best].append(i)
+            continue
+
+        reps.append(i)
+        members[i] = [i]
+        signatures[i] = sig
+        for b, key in enumerate(keys):
+            buckets[b].setdefault(key, []).append(i)
+
+    return reps, members
+
+
+def dedup_report(chunks, reps, members, top=10):
+    total = len(chunks)
+    kept = len(reps)
+    clusters = sorted((m for m in members.values() if len(m) > 1), key=len, reverse=True)
+    return {
+        "chunks": total,
+        "representatives": kept,
+        "collapsed": total - kept,
+        "shrink_ratio": round(1 - kept / total, 4) if total else 0.0,
+        "duplicate_clusters": len(clusters),
+        "largest_clusters": [
+            {
+                "chunk_id": chunks[m[0]]["chunk_id"],
+                "copies": len(m),
+                "documents": len({chunks[i]["doc_id"] for i in m}),
+                "preview": chunks[m[0]]["text"][:120],
+            }
+            for m in clusters[:top]
+        ],
+    }
@@ -0,0 +1,365 @@
+import os
+import json
+import zlib
+import fcntl
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from ai.config import (
+    TXT_DIR, DOCSTORE_DIR, DOCSTORE_SHARDS, DOCSTORE_BLOCK_CHARS,
+    DOCSTORE_SEGMENT_BYTES, DOCSTORE_CACHE_DOCS
+)
+
+
+class DocumentStore:
+    """
+    Compressed, sharded document store.
+
+    Documents are hashed to a shard by doc_id. Each shard appends
+    zlib-compressed blocks of text to segment files and records an
+    id -> (segment, offset, blocks) entry in its index log. Reads use
+    pread on cached file descriptors, so a lookup never opens a file.
+    Writers take an flock on the shard, so several processes (uvicorn
+    workers, the import CLI) can share one store.
+
+    Layout:
+        <root>/store.json
+        <root>/shard_007/index.jsonl
+        <root>/shard_007/lock
+        <root>/shard_007/seg_00000.seg
+    """
+
+    def __init__(self, root=DOCSTORE_DIR, num_shards=DOCSTORE_SHARDS,
+                 block_chars=DOCSTORE_BLOCK_CHARS,
+                 segment_bytes=DOCSTORE_SEGMENT_BYTES,
+                 cache_docs=DOCSTORE_CACHE_DOCS):
+        self.root = root
+        self.block_chars = block_chars
+        self.segment_bytes = segment_bytes
+        self.cache_docs = cache_docs
+        os.makedirs(root, exist_ok=True)
+
+        # The shard count is fixed once the store exists on disk
+        info_path = os.path.join(root, "store.json")
+        if os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                num_shards = json.load(f)["num_shards"]
+        else:
+            with open(info_path, "w", encoding="utf-8") as f:
+                json.dump({"num_shards": num_shards}, f)
+        self.num_shards = num_shards
+
+        self._index = {}                 # doc_id -> (shard, seg, offset, blocks)
+        self._attachments = {}           # doc_id -> {name: (shard, seg, offset, blocks)}
+        self._index_pos = [0] * num_shards
+        self._active_seg = [None] * num_shards
+        self._locks = [threading.Lock() for _ in range(num_shards)]
+        self._lock_fds = [None] * num_shards
+        self._index_lock = threading.Lock()   # guards _index/_attachments across shards
+        self._fds = {}                   # (shard, seg) -> read fd
+        self._fd_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        for shard in range(num_shards):
+            os.makedirs(self._shard_dir(shard), exist_ok=True)
+            self._refresh_shard(shard)
+
+    # ---------- paths ----------
+
+    def _shard_of(self, doc_id):
+        h = hashlib.md5(doc_id.encode("utf-8")).digest()
+        return int.from_bytes(h[:4], "little") % self.num_shards
+
+    def _shard_dir(self, shard):
+        return os.path.join(self.root, f"shard_{shard:03d}")
+
+    def _index_path(self, shard):
+        return os.path.join(self._shard_dir(shard), "index.jsonl")
+
+    def _segment_path(self, shard, seg):
+        return os.path.join(self._shard_dir(shard), f"seg_{seg:05d}.seg")
+
+    @contextmanager
+    def _writing(self, shard):
+        """Exclusive write access to a shard, across threads and processes."""
+        with self._locks[shard]:
+            if self._lock_fds[shard] is None:
+                path = os.path.join(self._shard_dir(shard), "lock")
+                self._lock_fds[shard] = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            fd = self._lock_fds[shard]
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    # ---------- index ----------
+
+    def _refresh_shard(self, shard):
+        """Replay index entries appended since the last refresh (possibly by another process)."""
+        with self._locks[shard]:
+            self._replay(shard)
+
+    def _replay(self, shard):
+        # Caller holds self._locks[shard]
+        path = self._index_path(shard)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            f.seek(self._index_pos[shard])
+            while True:
+                line = f.readline()
+                if not line.endswith("\n"):
+                    # Partially written entry; pick it up next time
+                    break
+                self._apply_entry(shard, json.loads(line))
+                self._index_pos[shard] = f.tell()
+
+    def _apply_entry(self, shard, entry):
+        doc_id = entry["doc_id"]
+        with self._index_lock:
+            if entry.get("deleted"):
+                self._index.pop(doc_id, None)
+                self._attachments.pop(doc_id, None)
+            elif entry.get("att"):
+                blocks = tuple(tuple(b) for b in entry["blocks"])
+                loc = (shard, entry["seg"], entry["offset"], blocks)
+                self._attachments.setdefault(doc_id, {})[entry["att"]] = loc
+                return
+            else:
+                blocks = tuple(tuple(b) for b in entry["blocks"])
+                self._index[doc_id] = (shard, entry["seg"], entry["offset"], blocks)
+        self._evict(doc_id)
+
+    def _append_entry(self, shard, entry):
+        # Caller is inside _writing(shard). Catch up on entries other processes
+        # appended first, then append ours and replay it like any other.
+        self._replay(shard)
+        with open(self._index_path(shard), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self._replay(shard)
+
+    def _active_segment(self, shard, incoming):
+        # Caller is inside _writing(shard), so the size is the true write offset
+        seg = self._active_seg[shard] or 0
+        # Another process may have rolled over to a newer segment
+        while os.path.exists(self._segment_path(shard, seg + 1)):
+            seg += 1
+        path = self._segment_path(shard, seg)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size > 0 and size + incoming > self.segment_bytes:
+            seg += 1
+            size = 0
+        self._active_seg[shard] = seg
+        return seg, size
+
+    # ---------- writes ----------
+
+    def put(self, doc_id, text):
+        """Store (or replace) a document."""
+        self._write(doc_id, text)
+
+    def put_attachment(self, doc_id, name, text):
+        """Store a small named record alongside a document (e.g. derived results)."""
+        self._write(doc_id, text, attachment=name)
+
+    def _write(self, doc_id, text, attachment=None):
+        blocks = []
+        payload = []
+        for start in range(0, max(len(text), 1), self.block_chars):
+            piece = text[start:start + self.block_chars]
+            data = zlib.compress(piece.encode("utf-8"), 6)
+            payload.append(data)
+            blocks.append([len(data), len(piece)])
+        payload = b"".join(payload)
+
+        shard = self._shard_of(doc_id)
+        with self._writing(shard):
+            seg, offset = self._active_segment(shard, len(payload))
+            # Data first, index entry second: an entry never points at missing bytes
+            with open(self._segment_path(shard, seg), "ab") as f:
+                f.write(payload)
+                f.flush()
+            entry = {"doc_id": doc_id, "seg": seg, "offset": offset, "blocks": blocks}
+            if attachment:
+                entry["att"] = attachment
+            self._append_entry(shard, entry)
+
+    def delete(self, doc_id):
+        shard = self._shard_of(doc_id)
+        with self._writing(shard):
+            self._append_entry(shard, {"doc_id": doc_id, "deleted": True})
+
+    # ---------- reads ----------
+
+    def _lookup(self, doc_id):
+        loc = self._index.get(doc_id)
+        if loc is None:
+            # May have been written by another process since we loaded
+            self._refresh_shard(self._shard_of(doc_id))
+            loc = self._index.get(doc_id)
+        return loc
+
+    def _fd(self, shard, seg):
+        key = (shard, seg)
+        fd = self._fds.get(key)
+        if fd is None:
+            with self._fd_lock:
+                fd = self._fds.get(key)
+                if fd is None:
+                    fd = os.open(self._segment_path(shard, seg), os.O_RDONLY)
+                    self._fds[key] = fd
+        return fd
+
+    def _read_blocks(self, loc, first, last):
+        """Decode blocks [first, last] of a document."""
+        shard, seg, offset, blocks = loc
+        start = offset + sum(b[0] for b in blocks[:first])
+        length = sum(b[0] for b in blocks[first:last + 1])
+        raw = os.pread(self._fd(shard, seg), length, start)
+        parts = []
+        pos = 0
+        for clen, _ in blocks[first:last + 1]:
+            parts.append(zlib.decompress(raw[pos:pos + clen]).decode("utf-8"))
+            pos += clen
+        return "".join(parts)
+
+    def _evict(self, doc_id):
+        with self._cache_lock:
+            self._cache.pop(doc_id, None)
+
+    def get(self, doc_id):
+        """Return the full text of a document, or None if it does not exist."""
+        with self._cache_lock:
+            text = self._cache.get(doc_id)
+            if text is not None:
+                self._cache.move_to_end(doc_id)
+                return text
+
+        loc = self._lookup(doc_id)
+        if loc is None:
+            return None
+        text = self._read_blocks(loc, 0, len(loc[3]) - 1)
+
+        with self._cache_lock:
+            self._cache[doc_id] = text
+            while len(self._cache) > self.cache_docs:
+                self._cache.popitem(last=False)
+        return text
+
+    def read_range(self, doc_id, start, end=None):
+        """Return text[start:end] of a document, decoding only the blocks it spans."""
+        loc = self._lookup(doc_id)
+        if loc is None:
+            return None
+        blocks = loc[3]
+        total = sum(b[1] for b in blocks)
+        end = total if end is None else min(end, total)
+        start = max(start, 0)
+        if start >= end:
+            return ""
+
+        first = last = None
+        pos = 0
+        for i, (_, n) in enumerate(blocks):
+            if first is None and start < pos + n:
+                first = i
+                first_pos = pos
+            if end <= pos + n:
+                last = i
+                break
+            pos += n
+        text = self._read_blocks(loc, first, last)
+        return text[start - first_pos:end - first_pos]
+
+    def get_attachment(self, doc_id, name):
+        """Return a named record stored with put_attachment, or None."""
+        loc = self._attachments.get(doc_id, {}).get(name)
+        if loc is None:
+            self._refresh_shard(self._shard_of(doc_id))
+            loc = self._attachments.get(doc_id, {}).get(name)
+            if loc is None:
+                return None
+        return self._read_blocks(loc, 0, len(loc[3]) - 1)
+
+    def length(self, doc_id):
+        loc = self._lookup(doc_id)
+        if loc is None:
+            return None
+        return sum(b[1] for b in loc[3])
+
+    def __contains__(self, doc_id):
+        return self._lookup(doc_id) is not None
+
+    def __len__(self):
+        return len(self._index)
+
+    def doc_ids(self):
+        with self._index_lock:
+            return list(self._index.keys())
+
+    def iter_documents(self):
+        """Yield (doc_id, text) for every document, reading segments sequentially."""
+        for shard in range(self.num_shards):
+            self._refresh_shard(shard)
+        with self._index_lock:
+            items = list(self._index.items())
+        items.sort(key=lambda kv: kv[1][:3])
+        for doc_id, loc in items:
+            yield doc_id, self._read_blocks(loc, 0, len(loc[3]) - 1)
+
+    # ---------- migration ----------
+
+    def import_txt_dir(self, txt_dir=TXT_DIR, skip_existing=True):
+        """Import loose .txt files (the old flat TXT_DIR layout). Returns the number imported."""
+        if not os.path.isdir(txt_dir):
+            return 0
+        count = 0
+        with os.scandir(txt_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".txt"):
+                    continue
+                doc_id = os.path.splitext(entry.name)[0]
+                if skip_existing and doc_id in self._index:
+                    continue
+                with open(entry.path, "r", encoding="utf-8", errors="ignore") as f:
+                    self.put(doc_id, f.read())
+                count += 1
+        return count
+
+    def close(self):
+        with self._fd_lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+        for shard, fd in enumerate(self._lock_fds):
+            if fd is not None:
+                os.close(fd)
+                self._lock_fds[shard] = None
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store():
+    """Process-wide document store; migrates the legacy TXT_DIR on first use."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                store = DocumentStore()
+                if len(store) == 0:
+                    n = store.import_txt_dir(TXT_DIR)
+                    if n:
+                        print(f"📦 Imported {n} TXT files into document store")
+                _STORE = store
+    return _STORE
+
+
+if __name__ == "__main__":
+    store = get_store()
+    n = store.import_txt_dir(TXT_DIR)
+    print(f"📦 Imported {n} new TXT files; store holds {len(store)} documents")
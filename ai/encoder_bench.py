@@ -0,0 +1,100 @@
+import sys
+import os
+import json
+import time
+import random
+import numpy as np
+from ai.config import CHUNKS_FILE
+from ai.encoders import get_encoder, ENCODERS
+from ai.versions import current_artifact_dir
+
+QUERIES = [
+    "What is the termination notice period?",
+    "Can termination occur without cause?",
+    "What liability caps or exclusions apply?",
+    "What indemnity obligations are specified?",
+    "Are there automatic renewal terms?",
+    "What confidentiality obligations and exceptions are defined?",
+    "What are payment terms and deadlines?",
+    "Are late fees or interest specified?",
+    "Which jurisdiction applies?",
+    "What is the governing law?",
+    "How are disputes resolved?",
+    "What are notice periods for key actions?",
+]
+
+
+def _percentile(values, p):
+    return float(np.percentile(values, p)) * 1000 if values else None
+
+
+def bench_encoder(encoder, texts, queries, reference=None, top_k=10):
+    """Throughput on the corpus, single-query latency, and agreement with a reference run."""
+    encoder.encode(texts[:8])                      # warm up
+    started = time.perf_counter()
+    doc_emb = encoder.encode(texts, batch_size=16)
+    corpus_s = time.perf_counter() - started
+
+    latencies = []
+    q_emb = []
+    for q in queries:
+        started = time.perf_counter()
+        q_emb.append(encoder.encode([q])[0])
+        latencies.append(time.perf_counter() - started)
+    q_emb = np.stack(q_emb)
+    top = np.argsort(-(q_emb @ doc_emb.T), axis=1)[:, :top_k]
+
+    result = {
+        "backend": encoder.name,
+        "model": encoder.model_name,
+        "dim": int(encoder.dim),
+        "corpus_chunks_per_s": round(len(texts) / corpus_s, 2),
+        "query_p50_ms": round(_percentile(latencies, 50), 2),
+        "query_p95_ms": round(_percentile(latencies, 95), 2),
+    }
+    if reference is not None:
+        ref_doc, ref_top = reference
+        overlap = [len(set(a) & set(b)) / top_k for a, b in zip(top, ref_top)]
+        result[f"recall@{top_k}_vs_reference"] = round(float(np.mean(overlap)), 4)
+        if ref_doc.shape == doc_emb.shape:
+            # Only meaningful for the same model (e.g. int8 ONNX vs fp32 PyTorch)
+            result["mean_cosine_vs_reference"] = round(float(np.mean(np.sum(ref_doc * doc_emb, axis=1))), 4)
+    return result, (doc_emb, top)
+
+
+def compare(backends=None, sample=500, top_k=10, seed=0):
+    """
+    Run every backend over the same sample of chunks and queries. The first
+    backend that loads is the reference for quality numbers.
+    """
+    backends = backends or list(ENCODERS)
+    # Chunks of the live version (or the legacy OUTPUT_DIR layout)
+    chunks_path = os.path.join(current_artifact_dir(), CHUNKS_FILE)
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        chunks = [json.loads(line) for line in f]
+    random.Random(seed).shuffle(chunks)
+    texts = [c["text"] for c in chunks[:sample]]
+
+    results = []
+    reference = None
+    for name in backends:
+        try:
+            encoder = get_encoder(name)
+        except Exception as e:
+            results.append({"backend": name, "skipped": str(e)})
+            continue
+        result, run = bench_encoder(encoder, texts, QUERIES, reference, top_k)
+        if reference is None:
+            reference = run
+            result["reference"] = True
+        results.append(result)
+        print(json.dumps(result))
+    return {"chunks": len(texts), "queries": len(QUERIES), "source": chunks_path, "results": results}
+
+
+if __name__ == "__main__":
+    # python -m ai.encoder_bench [backend ...]   e.g. sentence-transformers onnx hashing
+    report = compare(sys.argv[1:] or None)
+    with open("encoder_bench.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print("📊 Written to encoder_bench.json")
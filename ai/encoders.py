@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import zlib
+import numpy as np
+from ai.config import (
+    EMBED_MODEL, EMBED_BACKEND, ENCODER_THREADS, ENCODER_INFO_FILE,
+    ONNX_MODEL_DIR, ONNX_QUANTIZE, ONNX_MAX_LENGTH, HASHING_DIM
+)
+
+
+def _normalize(emb):
+    emb = np.asarray(emb, dtype="float32")
+    return emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-10)
+
+
+class SentenceTransformerEncoder:
+    """The original PyTorch fp32 path."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name=EMBED_MODEL, threads=ENCODER_THREADS):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=16, show_progress_bar=False):
+        emb = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=show_progress_bar,
+            convert_to_numpy=True,
+        )
+        return _normalize(emb)
+
+
+def onnx_export_dir(model_name=EMBED_MODEL):
+    """One export directory per model, so changing EMBED_MODEL never reuses a stale export."""
+    return os.path.join(ONNX_MODEL_DIR, re.sub(r"[^\w.-]+", "--", model_name))
+
+
+def export_onnx(model_name=EMBED_MODEL, model_dir=None, quantize=ONNX_QUANTIZE):
+    """
+    Export the transformer behind a sentence-transformers model to ONNX once,
+    optionally with dynamic int8 quantization of the weights. Returns the
+    path of the model to load. fp32 and int8 exports sit side by side in the
+    model's own directory.
+    """
+    model_dir = model_dir or onnx_export_dir(model_name)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        print("📤 Exporting", model_name, "to ONNX:", fp32_path)
+        os.makedirs(model_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        sample = tokenizer(["export"], return_tensors="pt")
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"]),
+                fp32_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "seq"},
+                    "attention_mask": {0: "batch", 1: "seq"},
+                    "last_hidden_state": {0: "batch", 1: "seq"},
+                },
+                opset_version=14,
+            )
+        tokenizer.save_pretrained(model_dir)
+
+    if not quantize:
+        return fp32_path
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print("🗜️ Quantizing ONNX model to int8:", int8_path)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime on CPU with int8 dynamic quantization and explicit thread
+    control. Reproduces all-mpnet-base-v2 pooling (mean over the attention
+    mask, then L2 normalization).
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name=EMBED_MODEL, model_dir=None,
+                 threads=ENCODER_THREADS, quantize=ONNX_QUANTIZE,
+                 max_length=ONNX_MAX_LENGTH):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_dir = model_dir or onnx_export_dir(model_name)
+        path = export_onnx(model_name, model_dir, quantize)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model_name = model_name
+        self.max_length = max_length
+        self.dim = self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, texts, batch_size=16, show_progress_bar=False):
+        from tqdm import tqdm
+
+        out = []
+        starts = range(0, len(texts), batch_size)
+        for start in tqdm(starts, disable=not show_progress_bar):
+            batch = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            mask = batch["attention_mask"].astype("int64")
+            hidden = self.session.run(None, {
+                "input_ids": batch["input_ids"].astype("int64"),
+                "attention_mask": mask,
+            })[0]
+            mask = mask[:, :, None].astype("float32")
+            out.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        if not out:
+            return np.zeros((0, self.dim), dtype="float32")
+        return _normalize(np.concatenate(out))
+
+
+class HashingEncoder:
+    """
+    Deterministic, dependency-free stand-in: signed hashed unigram and
+    bigram counts. Needs no model download, so tests and benchmarks can
+    run offline; lexical overlap is its only notion of similarity.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim=HASHING_DIM, **_):
+        self.model_name = f"hashing-{dim}"
+        self.dim = dim
+
+    def _vector(self, text):
+        vec = np.zeros(self.dim, dtype="float32")
+        words = re.findall(r"\w+", text.lower())
+        for feat in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            h = zlib.crc32(feat.encode("utf-8"))
+            vec[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        return np.sign(vec) * np.log1p(np.abs(vec))
+
+    def encode(self, texts, batch_size=16, show_progress_bar=False):
+        if not len(texts):
+            return np.zeros((0, self.dim), dtype="float32")
+        return _normalize(np.stack([self._vector(t) for t in texts]))
+
+
+ENCODERS = {
+    SentenceTransformerEncoder.name: SentenceTransformerEncoder,
+    OnnxEncoder.name: OnnxEncoder,
+    HashingEncoder.name: HashingEncoder,
+}
+
+
+def get_encoder(backend=EMBED_BACKEND, **kwargs):
+    if backend not in ENCODERS:
+        raise ValueError(f"Unknown embedding backend: {backend} (choose from {sorted(ENCODERS)})")
+    return ENCODERS[backend](**kwargs)
+
+
+def write_encoder_info(encoder, artifact_dir):
+    """Record which encoder built an index, so queries are embedded the same way."""
+    with open(os.path.join(artifact_dir, ENCODER_INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump({"backend": encoder.name, "model": encoder.model_name, "dim": int(encoder.dim)}, f)
+
+
+def read_encoder_info(artifact_dir):
+    path = os.path.join(artifact_dir, ENCODER_INFO_FILE)
+    if not os.path.exists(path):
+        # Indexes built before encoders were pluggable
+        return {"backend": SentenceTransformerEncoder.name, "model": EMBED_MODEL}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def query_encoder(artifact_dir, backend=EMBED_BACKEND):
+    """
+    (backend, kwargs) for get_encoder to embed queries against an index the
+    same way its chunks were embedded: same model, same dimension. The
+    configured backend is used when it runs the same model as the index's
+    (sentence-transformers and onnx are interchangeable); otherwise the
+    index's own backend wins.
+    """
+    info = read_encoder_info(artifact_dir)
+    model_backends = (SentenceTransformerEncoder.name, OnnxEncoder.name)
+    name = info["backend"]
+    if backend in model_backends and name in model_backends:
+        name = backend
+    if name == HashingEncoder.name:
+        return name, ({"dim": info["dim"]} if "dim" in info else {})
+    return name, {"model_name": info.get("model", EMBED_MODEL)}
+
+
+def encoder_matches(encoder, artifact_dir, backend=EMBED_BACKEND):
+    """True when an already-loaded encoder can embed queries for this index (for hot-swap reuse)."""
+    info = read_encoder_info(artifact_dir)
+    name, _ = query_encoder(artifact_dir, backend)
+    return (
+        encoder.name == name
+        and encoder.model_name == info.get("model", EMBED_MODEL)
+        and int(encoder.dim) == info.get("dim", encoder.dim)
+    )
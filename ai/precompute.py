@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import queue
+import itertools
+import threading
+from collections import OrderedDict
+from ai.config import (
+    PRECOMPUTE_WORKERS, PRECOMPUTE_CACHE_DOCS, PRECOMPUTE_MISS_TTL_S, PRECOMPUTE_NICE
+)
+from ai.doc_store import get_store
+
+ANSWERS_ATTACHMENT = "suggested_answers"
+
+
+def question_key(question):
+    return " ".join(question.lower().split())
+
+
+class _Job:
+    def __init__(self, doc_id, questions):
+        self.doc_id = doc_id
+        self.pending = {question_key(q) for q in questions}
+        self.answers = {}
+        self.cancelled = threading.Event()
+
+
+class AnswerPrecomputer:
+    """
+    Answers a document's suggested questions in low-priority background
+    threads right after upload, so clicking a suggestion is a lookup.
+
+    Finished answers are saved with the document in the document store.
+    cancel() drops the remaining questions of an abandoned document.
+    """
+
+    def __init__(self, answer_fn, workers=PRECOMPUTE_WORKERS, cache_docs=PRECOMPUTE_CACHE_DOCS,
+                 miss_ttl=PRECOMPUTE_MISS_TTL_S):
+        self.answer_fn = answer_fn          # answer_fn(question, doc_id) -> answers
+        self.workers = workers
+        self.cache_docs = cache_docs
+        self.miss_ttl = miss_ttl
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._done = OrderedDict()
+        self._misses = OrderedDict()        # doc_id -> monotonic time the miss expires
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"precompute-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, doc_id, questions, priority=10):
+        """Queue questions for doc_id; lower priority values run first."""
+        job = _Job(doc_id, questions)
+        with self._lock:
+            old = self._jobs.get(doc_id)
+            if old is not None:
+                old.cancelled.set()
+            self._jobs[doc_id] = job
+            self._start()
+        for q in questions:
+            self._queue.put((priority, next(self._seq), job, q))
+
+    def cancel(self, doc_id):
+        """Stop answering doc_id's remaining questions. Returns True if work was pending."""
+        with self._lock:
+            job = self._jobs.pop(doc_id, None)
+        if job is None:
+            return False
+        job.cancelled.set()
+        return True
+
+    def status(self, doc_id):
+        with self._lock:
+            job = self._jobs.get(doc_id)
+            if job is not None:
+                return {"state": "running", "answered": len(job.answers), "pending": len(job.pending)}
+        if self.answers(doc_id):
+            return {"state": "done"}
+        return {"state": "none"}
+
+    def lookup(self, doc_id, question):
+        """Precomputed answers for a question, or None."""
+        key = question_key(question)
+        with self._lock:
+            job = self._jobs.get(doc_id)
+            if job is not None and key in job.answers:
+                return job.answers[key]
+        return self.answers(doc_id).get(key)
+
+    def record(self, doc_id, question, answers):
+        """Keep an answer computed in the foreground so the background pass skips it."""
+        key = question_key(question)
+        with self._lock:
+            job = self._jobs.get(doc_id)
+            if job is None or key not in job.pending:
+                return
+            job.answers[key] = answers
+            job.pending.discard(key)
+            finished = self._close_if_finished(job)
+        if finished:
+            self._save(job)
+
+    def answers(self, doc_id):
+        """All saved answers for a document (question key -> answers)."""
+        with self._lock:
+            cached = self._done.get(doc_id)
+            if cached is not None:
+                self._done.move_to_end(doc_id)
+                return cached
+            # Most doc-scoped questions have no precomputed answer; remember that
+            # briefly so they don't reread the store's index, but not for good,
+            # since another API worker may still save answers for the document
+            if self._misses.get(doc_id, 0) > time.monotonic():
+                return {}
+        raw = get_store().get_attachment(doc_id, ANSWERS_ATTACHMENT)
+        if raw is None:
+            with self._lock:
+                self._misses[doc_id] = time.monotonic() + self.miss_ttl
+                self._misses.move_to_end(doc_id)
+                while len(self._misses) > self.cache_docs:
+                    self._misses.popitem(last=False)
+            return {}
+        answers = json.loads(raw)
+        self._remember(doc_id, answers)
+        return answers
+
+    def _remember(self, doc_id, answers):
+        with self._lock:
+            self._misses.pop(doc_id, None)
+            self._done[doc_id] = answers
+            while len(self._done) > self.cache_docs:
+                self._done.popitem(last=False)
+
+    def _run(self):
+        try:
+            # Linux applies niceness per thread, so only these workers yield CPU
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PRECOMPUTE_NICE)
+        except (AttributeError, OSError):
+            pass
+
+        while True:
+            _, _, job, question = self._queue.get()
+            key = question_key(question)
+            if job.cancelled.is_set() or key not in job.pending:
+                continue
+            try:
+                result = self.answer_fn(question, job.doc_id)
+            except Exception as e:
+                print(f"⚠️ Precompute failed for {job.doc_id}: {e}")
+                result = None
+
+            with self._lock:
+                if job.cancelled.is_set() or key not in job.pending:
+                    continue
+                if result is not None:
+                    job.answers[key] = result
+                job.pending.discard(key)
+                finished = self._close_if_finished(job)
+            if finished:
+                self._save(job)
+
+    def _close_if_finished(self, job):
+        # Caller holds self._lock
+        if job.pending:
+            return False
+        if self._jobs.get(job.doc_id) is job:
+            del self._jobs[job.doc_id]
+        return True
+
+    def _save(self, job):
+        get_store().put_attachment(job.doc_id, ANSWERS_ATTACHMENT, json.dumps(job.answers))
+        self._remember(job.doc_id, job.answers)
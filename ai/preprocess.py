@@ -2,7 +2,8 @@ import os
 import json
 import pandas as pd
 from tqdm import tqdm
-from ai.config import TXT_DIR, OUTPUT_DIR, CHUNK_JSONL, METADATA_CSV, CHUNK_SIZE, CHUNK_OVERLAP
+from ai.config import OUTPUT_DIR, CHUNKS_FILE, META_FILE, CHUNK_SIZE, CHUNK_OVERLAP
+from ai.doc_store import get_store
 
 
 def clean_text(text: str) -> str:
@@ -37,23 +38,18 @@ def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     return chunks
 
 
-def preprocess_contracts():
-    print("📄 Loading TXT files from:", TXT_DIR)
+def preprocess_contracts(out_dir=OUTPUT_DIR):
+    chunk_jsonl = os.path.join(out_dir, CHUNKS_FILE)
+    metadata_csv = os.path.join(out_dir, META_FILE)
 
-    txt_files = [f for f in os.listdir(TXT_DIR) if f.endswith(".txt")]
-    print(f"Found {len(txt_files)} contract TXT files.")
-    
-    metadata = []
-    jsonl_file = open(CHUNK_JSONL, "w", encoding="utf-8")
-
-    for file in tqdm(txt_files):
-        filepath = os.path.join(TXT_DIR, file)
-        doc_id = os.path.splitext(file)[0]
+    store = get_store()
+    print("📄 Loading contracts from document store:", store.root)
+    print(f"Found {len(store)} contracts.")
 
-        # Read file
-        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-            raw_text = f.read()
+    metadata = []
+    jsonl_file = open(chunk_jsonl, "w", encoding="utf-8")
 
+    for doc_id, raw_text in tqdm(store.iter_documents(), total=len(store)):
         clean = clean_text(raw_text)
         chunks = chunk_text(clean)
 
@@ -79,11 +75,11 @@ def preprocess_contracts():
             })
 
     jsonl_file.close()
-    pd.DataFrame(metadata).to_csv(METADATA_CSV, index=False)
+    pd.DataFrame(metadata).to_csv(metadata_csv, index=False)
 
     print("✅ Preprocessing complete!")
-    print("➡ Chunks saved to:", CHUNK_JSONL)
-    print("➡ Metadata saved to:", METADATA_CSV)
+    print("➡ Chunks saved to:", chunk_jsonl)
+    print("➡ Metadata saved to:", metadata_csv)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,5 @@
-from ai.retriever import ContractRetriever
-from ai.config import TXT_DIR
-from pathlib import Path
+from ai.retriever import LIVE_RETRIEVER
+from ai.doc_store import get_store
 import re
 
 
@@ -20,15 +19,13 @@ class LegalQASystem:
 
         texts = []
         if doc_id:
-            txt_path = Path(TXT_DIR) / f"{doc_id}.txt"
-            if not txt_path.exists():
+            t = get_store().get(doc_id)
+            if t is None:
                 return []
-            with open(txt_path, "r", encoding="utf-8") as f:
-                t = f.read()
             texts = [t]
         else:
-            retriever = ContractRetriever()
-            results = retriever.search(question, top_k=top_k)
+            with LIVE_RETRIEVER.acquire() as retriever:
+                results = retriever.search(question, top_k=top_k)
             texts = [r["text"] for r in results]
 
         best = []
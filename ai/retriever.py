@@ -1,55 +1,200 @@
-import json
-import numpy as np
-import pandas as pd
-import faiss
-from sentence_transformers import SentenceTransformer
-from ai.config import (
-    EMBED_MODEL,
-    FAISS_INDEX_PATH,
-    METADATA_CSV,
-    CHUNK_JSONL
+import os
+import time
+import threading
+from contextlib import contextmanager
+from ai.config import SHARD_BACKEND, VERSION_POLL_S, VERSION_RETRY_MAX_S
+from ai.sharded_index import open_searcher
+from ai.encoders import get_encoder, query_encoder, encoder_matches
+from ai.versions import (
+    current_version, current_artifact_dir, version_dir, verify_version, VersionCorrupt
 )
 
 
 class ContractRetriever:
 
-    def __init__(self):
-        print("🔍 Loading FAISS index...")
-        self.index = faiss.read_index(FAISS_INDEX_PATH)
+    def __init__(self, backend=SHARD_BACKEND, artifact_dir=None, encoder=None):
+        artifact_dir = artifact_dir or current_artifact_dir()
+        # Encoder first: if it fails there are no shard workers to clean up
+        if encoder is None or not encoder_matches(encoder, artifact_dir):
+            wanted, kwargs = query_encoder(artifact_dir)
+            print(f"🧠 Loading embedding model ({wanted}, {kwargs})...")
+            encoder = get_encoder(wanted, **kwargs)
+        self.encoder = encoder
 
-        print("📄 Loading metadata...")
-        self.meta = pd.read_csv(METADATA_CSV)
-
-        print("🧠 Loading embedding model...")
-        self.model = SentenceTransformer(EMBED_MODEL)
-
-        print("📦 Loading chunk texts...")
-        self.chunks = {}
-        with open(CHUNK_JSONL, "r", encoding="utf-8") as f:
-            for line in f:
-                row = json.loads(line)
-                self.chunks[row["chunk_id"]] = row["text"]
+        print(f"🔍 Loading FAISS index shards ({backend}) from {artifact_dir}...")
+        self.searcher = open_searcher(backend, artifact_dir)
 
     def embed_query(self, query):
-        emb = self.model.encode([query], convert_to_numpy=True)
-        emb = emb / (np.linalg.norm(emb) + 1e-10)
-        return emb.astype("float32")
+        return self.encoder.encode([query])
 
-    def search(self, query, top_k=5):
+    def search(self, query, top_k=5, expand=False):
+        """
+        Top-k chunks for a query. Each hit reports how many near-duplicate
+        copies it stands for ("copies"); expand=True also lists them
+        ("members", with doc_id and offsets).
+        """
         print("🔎 Searching for:", query)
 
         q_emb = self.embed_query(query)
-        scores, indices = self.index.search(q_emb, top_k)
-
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            row = self.meta.iloc[idx].to_dict()
-            row["score"] = float(score)
-            row["text"] = self.chunks.get(row["chunk_id"], "")
-            results.append(row)
+        results, failed = self.searcher.search(q_emb, top_k, expand)
+        if failed:
+            print(f"⚠️ Partial results: {len(failed)} shard(s) skipped")
 
         return results
 
+    def close(self):
+        self.searcher.close()
+
+
+class _Slot:
+    def __init__(self, retriever, version):
+        self.retriever = retriever
+        self.version = version
+        self.refs = 0
+        self.retired = False
+
+
+class RetrieverHolder:
+    """
+    Owns the live ContractRetriever and hot-swaps it when a new artifact
+    version is published.
+
+    A new version is verified, loaded and warmed up while the old one keeps
+    serving; the swap itself is a reference assignment under a lock.
+    Requests pin the retriever they started with, and a retired retriever
+    is closed only when its last request finishes.
+    """
+
+    def __init__(self, backend=SHARD_BACKEND):
+        self.backend = backend
+        self._live = None
+        self._lock = threading.Lock()       # guards _live, ref counts and _reloading
+        self._load_lock = threading.Lock()  # one load at a time
+        self._watcher = None
+        self._reloading = None
+
+    @property
+    def version(self):
+        slot = self._live
+        return slot.version if slot else None
+
+    @contextmanager
+    def acquire(self):
+        slot = self._pin()
+        try:
+            yield slot.retriever
+        finally:
+            self._unpin(slot)
+
+    def _pin(self):
+        while True:
+            with self._lock:
+                slot = self._live
+                if slot is not None:
+                    slot.refs += 1
+                    return slot
+            # Cold start: the first request loads the live version
+            self.load()
+
+    def _unpin(self, slot):
+        with self._lock:
+            slot.refs -= 1
+            close = slot.retired and slot.refs == 0
+        if close:
+            slot.retriever.close()
+
+    def load(self, version=None, force=False):
+        """Load a version (default: the one in CURRENT) and swap it in. Blocks until done."""
+        with self._load_lock:
+            name = version or current_version()
+            if self._live is not None and self._live.version == name and not force:
+                return
+
+            artifact_dir = version_dir(name) if name else current_artifact_dir()
+            if name:
+                verify_version(artifact_dir)
+
+            started = time.time()
+            old = self._live
+            # Reuse the already-warm encoder when the new version was built with the same one
+            retriever = ContractRetriever(
+                self.backend, artifact_dir, encoder=old.retriever.encoder if old else None
+            )
+            try:
+                retriever.search("termination notice period", top_k=1)  # warm up before serving
+            except Exception:
+                # Don't leak shard workers (process backend) of a version that never went live
+                retriever.close()
+                raise
+
+            with self._lock:
+                old = self._live
+                self._live = _Slot(retriever, name)
+                close = False
+                if old is not None:
+                    old.retired = True
+                    close = old.refs == 0
+            if close:
+                old.retriever.close()
+            print(f"🔁 Retriever now serving version {name or os.path.basename(artifact_dir)} "
+                  f"(loaded in {time.time() - started:.1f}s)")
+
+    def reload_async(self, version=None, force=False):
+        """Start a background load; returns None if one is already running."""
+        def run():
+            try:
+                self.load(version, force=force)
+            except Exception as e:
+                print(f"⚠️ Reload failed, keeping version {self.version}: {e}")
+
+        with self._lock:
+            if self._reloading is not None and self._reloading.is_alive():
+                return None
+            self._reloading = threading.Thread(target=run, daemon=True)
+            self._reloading.start()
+            return self._reloading
+
+    def start_watcher(self, poll_s=VERSION_POLL_S, retry_max_s=VERSION_RETRY_MAX_S):
+        """
+        Poll CURRENT and swap in newly published versions once a retriever is live.
+        A version that fails to load (e.g. a shard timing out during warm-up) is
+        retried with exponential back-off; only a corrupt one is given up on.
+        """
+        if self._watcher is not None:
+            return
+
+        def run():
+            corrupt = set()
+            failures = {}                   # version -> (attempts, monotonic retry time)
+            while True:
+                time.sleep(poll_s)
+                if self._live is None:
+                    continue
+                name = current_version()
+                if not name or name == self._live.version or name in corrupt:
+                    continue
+                attempts, retry_at = failures.get(name, (0, 0.0))
+                if time.monotonic() < retry_at:
+                    continue
+                try:
+                    self.load(name)
+                    failures.pop(name, None)
+                except VersionCorrupt as e:
+                    corrupt.add(name)
+                    print(f"⚠️ Version {name} is corrupt, keeping {self.version}: {e}")
+                except Exception as e:
+                    attempts += 1
+                    delay = min(retry_max_s, poll_s * 2 ** (attempts - 1))
+                    failures[name] = (attempts, time.monotonic() + delay)
+                    print(f"⚠️ Reload of {name} failed, keeping {self.version}; "
+                          f"retrying in {delay:.0f}s: {e}")
+
+        self._watcher = threading.Thread(target=run, daemon=True)
+        self._watcher.start()
+
+
+LIVE_RETRIEVER = RetrieverHolder()
+
 
 if __name__ == "__main__":
     r = ContractRetriever()
@@ -0,0 +1,419 @@
+import os
+import sys
+import json
+import math
+import time
+import heapq
+import socket
+import threading
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Connection, answer_challenge, deliver_challenge
+import pandas as pd
+import faiss
+from ai.config import (
+    OUTPUT_DIR, INDEX_FILE, META_FILE, CHUNKS_FILE, DUPLICATES_FILE,
+    SHARD_SUBDIR, SHARD_MANIFEST_FILE, SHARD_BACKEND, SHARD_SERVERS,
+    SHARD_AUTHKEY, SHARD_TIMEOUT_S, SHARD_MAX_FAILURES, SHARD_RETRY_S, SHARD_MAX_INFLIGHT
+)
+from ai.versions import current_artifact_dir
+
+
+def shard_dir(artifact_dir=OUTPUT_DIR):
+    return os.path.join(artifact_dir, SHARD_SUBDIR)
+
+
+def shard_path(shard_id, artifact_dir=OUTPUT_DIR):
+    return os.path.join(shard_dir(artifact_dir), f"shard_{shard_id:03d}")
+
+
+def load_manifest(artifact_dir=OUTPUT_DIR):
+    manifest_path = os.path.join(shard_dir(artifact_dir), SHARD_MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def shard_paths(artifact_dir=OUTPUT_DIR):
+    """Directories of every shard, falling back to the single-index layout in artifact_dir."""
+    manifest = load_manifest(artifact_dir)
+    if manifest is None:
+        return [artifact_dir]
+    return [os.path.join(shard_dir(artifact_dir), s["path"]) for s in manifest["shards"]]
+
+
+class IndexShard:
+    """One FAISS index plus the metadata and chunk texts of its rows."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index = faiss.read_index(os.path.join(path, INDEX_FILE))
+        self.meta = pd.read_csv(os.path.join(path, META_FILE)).to_dict("records")
+        wanted = {row["chunk_id"] for row in self.meta}
+        self.chunks = {}
+        with open(os.path.join(path, CHUNKS_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if row["chunk_id"] in wanted:
+                    self.chunks[row["chunk_id"]] = row["text"]
+
+        # Representative chunk_id -> every near-duplicate copy (see ai/dedup.py)
+        self.duplicates = {}
+        dup_path = os.path.join(path, DUPLICATES_FILE)
+        if os.path.exists(dup_path):
+            with open(dup_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    self.duplicates[row["chunk_id"]] = row["members"]
+
+    def search(self, q_emb, top_k, expand=False):
+        scores, indices = self.index.search(q_emb, top_k)
+        results = []
+        for score, idx in zip(scores[0], indices[0]):
+            if idx < 0:
+                continue
+            row = dict(self.meta[idx])
+            row["score"] = float(score)
+            row["text"] = self.chunks.get(row["chunk_id"], "")
+            members = self.duplicates.get(row["chunk_id"])
+            row["copies"] = len(members) if members else 1
+            if expand and members:
+                row["members"] = members
+            results.append(row)
+        return results
+
+
+# ---------- shard clients ----------
+
+class LocalShardClient:
+    """Shard searched in this process; FAISS releases the GIL, so threads run in parallel."""
+
+    def __init__(self, path):
+        self.name = path
+        self.shard = IndexShard(path)
+
+    def search(self, q_emb, top_k, expand=False):
+        return self.shard.search(q_emb, top_k, expand)
+
+    def close(self):
+        pass
+
+
+_WORKER_SHARD = None
+
+
+def _init_worker(path):
+    global _WORKER_SHARD
+    _WORKER_SHARD = IndexShard(path)
+
+
+def _worker_search(q_emb, top_k, expand):
+    return _WORKER_SHARD.search(q_emb, top_k, expand)
+
+
+class ProcessShardClient:
+    """Shard held by a dedicated worker process, restarted if the process dies."""
+
+    def __init__(self, path):
+        self.name = path
+        self.path = path
+        self._lock = threading.Lock()
+        self.pool = self._start()
+
+    def _start(self):
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.path,),
+        )
+
+    def search(self, q_emb, top_k, expand=False):
+        pool = self.pool
+        try:
+            return pool.submit(_worker_search, q_emb, top_k, expand).result()
+        except BrokenProcessPool:
+            # Replace the dead worker so the next query (the searcher's probe) finds a live one
+            with self._lock:
+                if self.pool is pool:
+                    self.pool = self._start()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _parse_address(addr):
+    host, port = addr.rsplit(":", 1)
+    return host, int(port)
+
+
+def _require_authkey():
+    if not SHARD_AUTHKEY:
+        raise ValueError("Remote shards need a shared key: set LEGALLENS_SHARD_AUTHKEY")
+    return SHARD_AUTHKEY
+
+
+class RemoteShardClient:
+    """
+    Shard served by a separate `serve` process, possibly on another machine.
+    Every connect and reply is bounded by `timeout`; a connection that times
+    out is closed rather than returned to the idle list.
+    """
+
+    def __init__(self, address, timeout=SHARD_TIMEOUT_S):
+        self.name = address
+        self.address = _parse_address(address)
+        self.timeout = timeout
+        self.authkey = _require_authkey()
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock.setblocking(True)
+        conn = Connection(sock.detach())
+        try:
+            # A live server sends its challenge at once; don't wait on one that never will
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Shard {self.name} did not answer the handshake")
+            answer_challenge(conn, self.authkey)
+            deliver_challenge(conn, self.authkey)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def search(self, q_emb, top_k, expand=False):
+        conn = self._connect()
+        try:
+            conn.send((q_emb, top_k, expand))
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Shard {self.name} did not reply within {self.timeout}s")
+            results = conn.recv()
+        except Exception:
+            conn.close()
+            raise
+        with self._lock:
+            self._idle.append(conn)
+        if isinstance(results, Exception):
+            raise results
+        return results
+
+    def close(self):
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+
+
+# ---------- scatter-gather ----------
+
+class ShardsUnavailable(RuntimeError):
+    """No shard answered a query; carries a Retry-After hint in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__("All index shards failed or timed out")
+        self.retry_after = retry_after
+
+
+class _ShardHealth:
+    __slots__ = ("failures", "retry_at", "probing", "inflight")
+
+    def __init__(self):
+        self.failures = 0
+        self.retry_at = 0.0
+        self.probing = False
+        self.inflight = 0
+
+
+class ShardedSearcher:
+    """
+    Fan a query out to every shard in parallel and merge the global top-k.
+
+    A shard that errors or misses the timeout is left out of that result
+    (reported as failed). Only after SHARD_MAX_FAILURES consecutive failures
+    is it backed off, for an exponentially growing interval capped at
+    SHARD_RETRY_S; after that a single query is let through as a probe and
+    its outcome decides whether the shard is back. When every shard is
+    backed off, all of them are probed rather than failing the query
+    outright. Each shard takes at most SHARD_MAX_INFLIGHT requests at once,
+    so a hung shard cannot tie up the whole pool.
+
+    With a single shard there are no partial results to fall back on, so
+    the timeout does not apply: a slow search is just slow.
+    """
+
+    def __init__(self, clients, timeout=SHARD_TIMEOUT_S, max_failures=SHARD_MAX_FAILURES,
+                 retry_after=SHARD_RETRY_S, max_inflight=SHARD_MAX_INFLIGHT):
+        self.clients = clients
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self.max_inflight = max_inflight
+        self._health = {client.name: _ShardHealth() for client in clients}
+        self._lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_inflight * len(clients))
+
+    def _select(self):
+        """Split the shards into those to query now and those to report as failed."""
+        now = time.monotonic()
+        send, backed_off, failed = [], [], []
+        with self._lock:
+            for client in self.clients:
+                h = self._health[client.name]
+                if h.inflight >= self.max_inflight:
+                    failed.append(client.name)
+                elif h.failures < self.max_failures:
+                    send.append(client)
+                elif not h.probing and now >= h.retry_at:
+                    h.probing = True
+                    send.append(client)
+                else:
+                    backed_off.append(client)
+            if not send:
+                # Never skip every shard; probe the backed-off ones instead
+                send, backed_off = backed_off, []
+                for client in send:
+                    self._health[client.name].probing = True
+            for client in send:
+                self._health[client.name].inflight += 1
+        return send, failed + [c.name for c in backed_off]
+
+    def _call(self, client, q_emb, top_k, expand):
+        try:
+            return client.search(q_emb, top_k, expand)
+        finally:
+            # Released when the call really ends, not when the searcher stops waiting
+            with self._lock:
+                self._health[client.name].inflight -= 1
+
+    def _record(self, client, ok):
+        with self._lock:
+            h = self._health[client.name]
+            h.probing = False
+            if ok:
+                h.failures = 0
+                return
+            h.failures += 1
+            if h.failures >= self.max_failures:
+                backoff = self.timeout * 2 ** (h.failures - self.max_failures)
+                h.retry_at = time.monotonic() + min(self.retry_after, backoff)
+
+    def search(self, q_emb, top_k=5, expand=False):
+        send, failed = self._select()
+        futures = {self.pool.submit(self._call, c, q_emb, top_k, expand): c for c in send}
+
+        done, not_done = wait(futures, timeout=self.timeout if len(self.clients) > 1 else None)
+
+        hits = []
+        ok = 0
+        for fut in done:
+            client = futures[fut]
+            try:
+                hits.extend(fut.result())
+                ok += 1
+                self._record(client, True)
+            except Exception as e:
+                print(f"⚠️ Shard {client.name} failed: {e}")
+                self._record(client, False)
+                failed.append(client.name)
+        for fut in not_done:
+            print(f"⚠️ Shard {futures[fut].name} timed out")
+            self._record(futures[fut], False)
+            failed.append(futures[fut].name)
+
+        if not ok:
+            raise ShardsUnavailable(self._retry_after())
+
+        return heapq.nlargest(top_k, hits, key=lambda r: r["score"]), failed
+
+    def _retry_after(self):
+        now = time.monotonic()
+        with self._lock:
+            waits = [h.retry_at - now for h in self._health.values() if h.retry_at > now]
+        return max(1, math.ceil(min(waits))) if waits else 1
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        for client in self.clients:
+            client.close()
+
+
+def open_searcher(backend=SHARD_BACKEND, artifact_dir=OUTPUT_DIR):
+    if backend == "remote":
+        if not SHARD_SERVERS:
+            raise ValueError("SHARD_BACKEND is 'remote' but SHARD_SERVERS is empty")
+        clients = [RemoteShardClient(a) for a in SHARD_SERVERS]
+    elif backend == "process":
+        clients = [ProcessShardClient(p) for p in shard_paths(artifact_dir)]
+    elif backend == "thread":
+        clients = [LocalShardClient(p) for p in shard_paths(artifact_dir)]
+    else:
+        raise ValueError(f"Unknown shard backend: {backend}")
+    return ShardedSearcher(clients)
+
+
+# ---------- shard server ----------
+
+def _handle(conn, shard):
+    with conn:
+        while True:
+            try:
+                q_emb, top_k, expand = conn.recv()
+            except EOFError:
+                return
+            try:
+                conn.send(shard.search(q_emb, top_k, expand))
+            except Exception as e:
+                conn.send(e)
+
+
+def serve_shard(path, host="127.0.0.1", port=7100):
+    """Serve one shard over multiprocessing.connection until killed."""
+    authkey = _require_authkey()
+    shard = IndexShard(path)
+    print(f"🧩 Serving shard {path} on {host}:{port}")
+    with Listener((host, port), authkey=authkey) as listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except (EOFError, OSError, AuthenticationError) as e:
+                # A client that gave up or failed the handshake must not stop the server
+                print(f"⚠️ Rejected shard connection: {e!r}")
+                continue
+            threading.Thread(target=_handle, args=(conn, shard), daemon=True).start()
+
+
+def serve_all(host="127.0.0.1", base_port=7100, artifact_dir=None):
+    """
+    Start one local server process per shard of the live version on consecutive ports.
+    Servers do not hot-swap; restart them after publishing a new version.
+    """
+    ctx = mp.get_context("spawn")
+    procs = []
+    for i, path in enumerate(shard_paths(artifact_dir or current_artifact_dir())):
+        p = ctx.Process(target=serve_shard, args=(path, host, base_port + i))
+        p.start()
+        procs.append(p)
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    # python -m ai.sharded_index serve <shard_id> [port]
+    # python -m ai.sharded_index serve-all [base_port]
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "serve-all"
+    if cmd == "serve":
+        shard_id = int(sys.argv[2])
+        port = int(sys.argv[3]) if len(sys.argv) > 3 else 7100 + shard_id
+        serve_shard(shard_paths(current_artifact_dir())[shard_id], port=port)
+    else:
+        serve_all(base_port=int(sys.argv[2]) if len(sys.argv) > 2 else 7100)
@@ -1,7 +1,6 @@
 import numpy as np
-from ai.config import TXT_DIR
 from ai.preprocess import chunk_text
-from pathlib import Path
+from ai.doc_store import get_store
 import re
 
 
@@ -16,12 +15,9 @@ class ContractSummarizer:
         """
         print(f"📝 Summarizing document: {doc_id}")
 
-        txt_path = Path(TXT_DIR) / f"{doc_id}.txt"
-        if not txt_path.exists():
+        raw = get_store().get(doc_id)
+        if raw is None:
             return "❌ Document not found."
-
-        with open(txt_path, "r", encoding="utf-8") as f:
-            raw = f.read()
         # Sentence-based summarization: select 7–15 key sentences
         t = raw
         sents = re.split(r"(?<=[\.\!\?])\s+", t.strip())
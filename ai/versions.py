@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+from datetime import datetime
+from ai.config import (
+    OUTPUT_DIR, VERSIONS_DIR, CURRENT_VERSION_FILE, VERSIONS_KEEP,
+    NUM_INDEX_SHARDS, ENCODER_INFO_FILE
+)
+
+MANIFEST_FILE = "manifest.json"
+STAGING_PREFIX = ".staging-"
+
+
+def version_dir(name):
+    return os.path.join(VERSIONS_DIR, name)
+
+
+def current_version():
+    """Name of the published version, or None when only the legacy OUTPUT_DIR layout exists."""
+    try:
+        with open(CURRENT_VERSION_FILE, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name or None
+
+
+def current_artifact_dir():
+    name = current_version()
+    return version_dir(name) if name else OUTPUT_DIR
+
+
+def list_versions():
+    if not os.path.isdir(VERSIONS_DIR):
+        return []
+    return sorted(
+        n for n in os.listdir(VERSIONS_DIR)
+        if not n.startswith(STAGING_PREFIX)
+        and os.path.exists(os.path.join(version_dir(n), MANIFEST_FILE))
+    )
+
+
+class VersionCorrupt(ValueError):
+    """A version directory is missing its manifest or an artifact does not match its checksum."""
+
+
+# ---------- manifest ----------
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _artifact_files(root):
+    for dirpath, _, files in os.walk(root):
+        for fn in files:
+            rel = os.path.relpath(os.path.join(dirpath, fn), root)
+            if rel != MANIFEST_FILE:
+                yield rel.replace(os.sep, "/")
+
+
+def write_manifest(root, name, num_shards):
+    files = {}
+    for rel in sorted(_artifact_files(root)):
+        path = os.path.join(root, rel)
+        files[rel] = {"sha256": _sha256(path), "bytes": os.path.getsize(path)}
+    encoder = {}
+    encoder_path = os.path.join(root, ENCODER_INFO_FILE)
+    if os.path.exists(encoder_path):
+        with open(encoder_path, "r", encoding="utf-8") as f:
+            encoder = json.load(f)
+    manifest = {
+        "version": name,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "encoder": encoder,
+        "num_shards": num_shards,
+        "files": files,
+    }
+    with open(os.path.join(root, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def verify_version(root):
+    """Check every artifact against the manifest; raise VersionCorrupt on a missing or torn file."""
+    manifest_path = os.path.join(root, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise VersionCorrupt(f"No manifest in {root}")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    for rel, info in manifest["files"].items():
+        path = os.path.join(root, rel)
+        if not os.path.exists(path):
+            raise VersionCorrupt(f"{rel} is missing from {root}")
+        if os.path.getsize(path) != info["bytes"] or _sha256(path) != info["sha256"]:
+            raise VersionCorrupt(f"{rel} does not match its checksum in {root}")
+    return manifest
+
+
+# ---------- build / publish ----------
+
+def publish(name):
+    """Point CURRENT at a verified version. os.replace makes the switch atomic."""
+    verify_version(version_dir(name))
+    tmp = CURRENT_VERSION_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CURRENT_VERSION_FILE)
+    print("📌 Published version:", name)
+
+
+def prune(keep=VERSIONS_KEEP):
+    """Delete the oldest versions (never the live one) and abandoned staging dirs."""
+    live = current_version()
+    versions = list_versions()
+    for name in versions[:-keep] if keep else versions:
+        if name != live:
+            shutil.rmtree(version_dir(name), ignore_errors=True)
+    if os.path.isdir(VERSIONS_DIR):
+        for n in os.listdir(VERSIONS_DIR):
+            path = version_dir(n)
+            # Staging dirs older than a day belong to crashed builds
+            if n.startswith(STAGING_PREFIX) and time.time() - os.path.getmtime(path) > 86400:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def build_version(num_shards=NUM_INDEX_SHARDS, publish_now=True):
+    """
+    Preprocess and index into a staging directory, seal it with a manifest,
+    rename it into place and (optionally) publish it. Nothing a reader can see
+    is ever written in place.
+    """
+    from ai.preprocess import preprocess_contracts
+    from ai.build_index import build_index
+
+    # Microseconds keep names sortable by build time, which list_versions and prune rely on
+    name = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    staging = version_dir(STAGING_PREFIX + name)
+    os.makedirs(staging)
+    try:
+        preprocess_contracts(staging)
+        build_index(num_shards, staging)
+        write_manifest(staging, name, num_shards)
+        os.rename(staging, version_dir(name))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    print("📦 Built version:", name)
+    if publish_now:
+        publish(name)
+        prune()
+    return name
+
+
+if __name__ == "__main__":
+    # python -m ai.versions build [num_shards]
+    # python -m ai.versions publish <name>     (also used to roll back)
+    # python -m ai.versions list
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if cmd == "build":
+        build_version(int(sys.argv[2]) if len(sys.argv) > 2 else NUM_INDEX_SHARDS)
+    elif cmd == "publish":
+        publish(sys.argv[2])
+    else:
+        live = current_version()
+        for n in list_versions():
+            print(("* " if n == live else "  ") + n)
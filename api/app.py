@@ -1,14 +1,17 @@
 # api/app.py
 import os
 from fastapi import HTTPException
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Header, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from ai.risk_detector import RiskDetector
 from pathlib import Path
 import uuid
 import sys
+import threading
 import io
+import anyio
 
 # Add project root to path
 ROOT = str(Path(__file__).resolve().parents[1])
@@ -18,16 +21,53 @@ if ROOT not in sys.path:
 # Import AI modules
 from ai.preprocess import preprocess_contracts
 from ai.build_index import build_index
-from ai.retriever import ContractRetriever
+from ai.retriever import ContractRetriever, LIVE_RETRIEVER
+from ai.versions import current_version, list_versions
 from ai.summarizer import ContractSummarizer
 from ai.qa_reader import LegalQASystem
-from ai.config import TXT_DIR
+from ai.precompute import AnswerPrecomputer
+from ai.doc_store import get_store
+from ai.sharded_index import ShardsUnavailable
+from api.scheduler import SCHEDULER, Overloaded, INTERACTIVE, BULK
 from PyPDF2 import PdfReader
 from pdfminer.high_level import extract_text as pdfminer_extract_text
 import re
 
 app = FastAPI(title="Contract Intelligence API")
 
+
+def overloaded_response(exc: Overloaded):
+    return JSONResponse(
+        {"error": "Server busy, please retry", "resource": exc.resource},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.middleware("http")
+async def admit_uploads(request: Request, call_next):
+    """
+    Turn uploads away before their body is read when the limiters they need
+    are already full, instead of buffering the file only to reject it.
+    Every upload needs io. The extension is inside the body, so pdf is only
+    checked here when the client declares it with X-Upload-Type: pdf;
+    otherwise upload_file checks it once the filename is known.
+    Added before CORS so 429s still carry CORS headers.
+    """
+    if request.method == "POST" and request.url.path == "/upload":
+        try:
+            deadline = queue_deadline(int(request.headers.get("x-queue-deadline-ms") or 0))
+        except ValueError:
+            deadline = None
+        try:
+            SCHEDULER.check("io", BULK, deadline)
+            if request.headers.get("x-upload-type", "").lower() == "pdf":
+                SCHEDULER.check("pdf", BULK, deadline)
+        except Overloaded as exc:
+            return overloaded_response(exc)
+    return await call_next(request)
+
+
 # Allow requests from frontend
 app.add_middleware(
     CORSMiddleware,
@@ -39,7 +79,43 @@ app.add_middleware(
 
 SUM = None
 QA = None
+PRECOMPUTE = None
+PRECOMPUTE_LOCK = threading.Lock()
 RISK = RiskDetector()
+
+
+@app.on_event("startup")
+def start_version_watcher():
+    # Swap in newly published index versions without a restart
+    LIVE_RETRIEVER.start_watcher()
+
+
+@app.on_event("startup")
+async def size_threadpool():
+    # Admission control decides what waits; make sure the threadpool never queues first
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, SCHEDULER.capacity() + 8)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    return overloaded_response(exc)
+
+
+@app.exception_handler(ShardsUnavailable)
+async def shards_unavailable_handler(request, exc: ShardsUnavailable):
+    return JSONResponse(
+        {"error": "Search index unavailable, please retry"},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def queue_deadline(x_queue_deadline_ms: int = Header(None)):
+    """Optional per-request bound on queueing time, in milliseconds."""
+    return x_queue_deadline_ms / 1000 if x_queue_deadline_ms else None
+
+
 def suggest_from_risks(risks):
     templates = {
         "termination": [
@@ -101,109 +177,126 @@ def ensure_loaded():
     return SUM, QA
 
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in [".txt", ".pdf"]:
-        return JSONResponse({"error": "Only .txt or .pdf"}, status_code=400)
+def ensure_precompute():
+    global PRECOMPUTE
+    with PRECOMPUTE_LOCK:
+        if PRECOMPUTE is None:
+            _, qa_system = ensure_loaded()
 
-    filename = f"user_{uuid.uuid4().hex}.txt"
-    save_path = Path(TXT_DIR) / filename
+            def answer(question, doc_id):
+                with SCHEDULER.slot("io", BULK):
+                    return qa_system.answer(question, doc_id=doc_id)
 
-    contents = await file.read()
+            PRECOMPUTE = AnswerPrecomputer(answer)
+    return PRECOMPUTE
+
+
+def ingest_document(doc_id, text):
+    """Store a new document and compute what the UI shows right after upload."""
+    SUM, _ = ensure_loaded()
+    get_store().put(doc_id, text)
+    summary = SUM.summarize_document(doc_id)
+
+    risks = RISK.analyze(text)
+
+    queries = suggest_from_risks(risks)
+    # Answer the suggestions in the background so clicking one is instant
+    ensure_precompute().submit(doc_id, queries)
+
+    return {"ok": True, "doc_id": doc_id, "summary": summary, "risks": risks, "queries": queries}
+
+
+def ingest_upload(ext, contents, deadline=None):
+    doc_id = f"user_{uuid.uuid4().hex}"
 
     if ext == ".pdf":
-        text = extract_pdf_text(contents)
-        with open(save_path, "w", encoding="utf-8") as f:
-            f.write(text)
+        with SCHEDULER.slot("pdf", BULK, deadline):
+            text = extract_pdf_text(contents)
     else:
         try:
             text = contents.decode("utf-8", errors="ignore")
         except Exception:
             text = contents.decode("latin-1", errors="ignore")
-        with open(save_path, "w", encoding="utf-8") as f:
-            f.write(clean_text(text))
+        text = clean_text(text)
 
-    doc_id = filename.replace(".txt", "")
-    global SUM
-    if SUM is None:
-        SUM = ContractSummarizer()
-    summary = SUM.summarize_document(doc_id)
+    with SCHEDULER.slot("io", BULK, deadline):
+        return ingest_document(doc_id, text)
 
-    txt_path = Path(TXT_DIR) / f"{doc_id}.txt"
-    with open(txt_path, "r", encoding="utf-8") as f:
-        raw_text = f.read()
-    risks = RISK.analyze(raw_text)
 
-    queries = suggest_from_risks(risks)
+@app.post("/upload")
+async def upload_file(file: UploadFile = File(...), deadline: float = Depends(queue_deadline)):
+    ext = os.path.splitext(file.filename)[1].lower()
+    if ext not in [".txt", ".pdf"]:
+        return JSONResponse({"error": "Only .txt or .pdf"}, status_code=400)
+    if ext == ".pdf":
+        # Reject before pulling the file into memory; ingest_upload takes the slot
+        SCHEDULER.check("pdf", BULK, deadline)
 
-    return {"ok": True, "doc_id": doc_id, "summary": summary, "risks": risks, "queries": queries}
+    contents = await file.read()
+
+    # PDF extraction and summarizing are CPU-bound; keep them off the event loop
+    return await run_in_threadpool(ingest_upload, ext, contents, deadline)
 
 
 @app.post("/summarize")
-def summarize(doc_id: str = Form(...)):
+def summarize(doc_id: str = Form(...), deadline: float = Depends(queue_deadline)):
     SUM, _ = ensure_loaded()
-    result = SUM.summarize_document(doc_id)
+    with SCHEDULER.slot("io", INTERACTIVE, deadline):
+        result = SUM.summarize_document(doc_id)
     return {"summary": result}
 
 
 @app.post("/qa")
-def qa(question: str = Form(...), doc_id: str = Form(None)):
+def qa(question: str = Form(...), doc_id: str = Form(None), deadline: float = Depends(queue_deadline)):
     _, QA = ensure_loaded()
-    answers = QA.answer(question, doc_id=doc_id)
+    if doc_id:
+        answers = ensure_precompute().lookup(doc_id, question)
+        if answers is not None:
+            return {"answers": answers}
+    # Corpus-wide questions go through the embedding model; doc-scoped ones only read the document
+    with SCHEDULER.slot("io" if doc_id else "encoder", INTERACTIVE, deadline):
+        answers = QA.answer(question, doc_id=doc_id)
+    if doc_id:
+        ensure_precompute().record(doc_id, question, answers)
     return {"answers": answers}
+
+
+@app.post("/abandon")
+def abandon(doc_id: str = Form(...)):
+    """
+    Called when the user leaves a document; cancels its pending background answers.
+    """
+    return {"doc_id": doc_id, "cancelled": ensure_precompute().cancel(doc_id)}
+
 @app.post("/upload_text")
-def upload_text(text: str = Form(...)):
+def upload_text(text: str = Form(...), deadline: float = Depends(queue_deadline)):
     """
-    Accept pasted text from the UI, save as txt, run preprocess+index, and return doc_id.
+    Accept pasted text from the UI, save it to the document store, and return doc_id.
     """
     # create a deterministic doc id so subsequent calls can reference it
     doc_id = f"user_paste_{uuid.uuid4().hex[:8]}"
-    save_path = Path(TXT_DIR) / f"{doc_id}.txt"
-    with open(save_path, "w", encoding="utf-8") as f:
-        f.write(text)
-
-    try:
-        pass
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Pipeline failed: {e}")
-
-    global SUM
-    if SUM is None:
-        SUM = ContractSummarizer()
-    summary = SUM.summarize_document(doc_id)
-
-    with open(save_path, "r", encoding="utf-8") as f:
-        raw_text = f.read()
-    risks = RISK.analyze(raw_text)
-
-    queries = suggest_from_risks(risks)
-
-    return {"ok": True, "doc_id": doc_id, "summary": summary, "risks": risks, "queries": queries}
+    with SCHEDULER.slot("io", BULK, deadline):
+        return ingest_document(doc_id, text)
 
 @app.post("/risk")
-def risk(doc_id: str = Form(...)):
+def risk(doc_id: str = Form(...), deadline: float = Depends(queue_deadline)):
     """
     Run simple risk detector on the document's raw text and return risk list.
     """
-    txt_path = Path(TXT_DIR) / f"{doc_id}.txt"
-    if not txt_path.exists():
-        raise HTTPException(status_code=404, detail="Document not found")
+    with SCHEDULER.slot("io", INTERACTIVE, deadline):
+        text = get_store().get(doc_id)
+        if text is None:
+            raise HTTPException(status_code=404, detail="Document not found")
 
-    with open(txt_path, "r", encoding="utf-8") as f:
-        text = f.read()
-
-    items = RISK.analyze(text)  # returns list of {"type","weight","context"}
+        items = RISK.analyze(text)  # returns list of {"type","weight","context"}
     # convert weight to a numeric score if you like; keep as str for UI
     return {"doc_id": doc_id, "risks": items}
 
 @app.post("/auto_queries")
 def auto_queries(doc_id: str = Form(None)):
     if doc_id:
-        txt_path = Path(TXT_DIR) / f"{doc_id}.txt"
-        if txt_path.exists():
-            with open(txt_path, "r", encoding="utf-8") as f:
-                text = f.read()
+        text = get_store().get(doc_id)
+        if text is not None:
             risks = RISK.analyze(text)
             return {"doc_id": doc_id, "queries": suggest_from_risks(risks)}
     suggestions = [
@@ -234,3 +327,25 @@ def extract_pdf_text(contents: bytes) -> str:
         return clean_text(text)
     except Exception:
         return ""
+
+
+@app.get("/admin/scheduler")
+def admin_scheduler():
+    return SCHEDULER.stats()
+
+
+@app.get("/admin/version")
+def admin_version():
+    return {"live": LIVE_RETRIEVER.version, "current": current_version(), "versions": list_versions()}
+
+
+@app.post("/admin/reload")
+def admin_reload(version: str = Form(None), force: bool = Form(False)):
+    """
+    Load a version (default: the published one) in the background and hot-swap it in.
+    The old retriever keeps serving until the new one is ready. Reloading the live
+    version is a no-op unless force is set, and only one reload runs at a time.
+    """
+    started = LIVE_RETRIEVER.reload_async(version, force=force) is not None
+    return {"ok": True, "started": started, "live": LIVE_RETRIEVER.version,
+            "loading": version or current_version()}
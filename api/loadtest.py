@@ -0,0 +1,397 @@
+"""
+Replay mixed API traffic against api/app.py and report tail latency.
+
+Runs offline: the harness points LEGALLENS_OUTPUT_DIR and
+LEGALLENS_TXT_DIR at a scratch directory (so the real CUAD texts are not
+imported into the store), switches to the deterministic hashing encoder, seeds a small
+synthetic corpus and publishes an index version before any request.
+
+    python -m api.loadtest --duration 30 --concurrency 16
+    python -m api.loadtest --rate 40 --mix qa_corpus=5,upload_pdf=1
+    python -m api.loadtest --spawn-server --port 8765     # real uvicorn process
+    python -m api.loadtest --url http://127.0.0.1:8000 --server-pid 1234
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+DEFAULT_MIX = "qa_corpus=3,qa_doc=3,qa_suggested=2,risk=2,summarize=1,upload_pdf=1,upload_text=1"
+
+CLAUSES = [
+    "Either party may terminate this Agreement upon {n} days prior written notice to the other party.",
+    "This Agreement shall automatically renew for successive one year terms unless either party gives notice of non-renewal.",
+    "In no event shall either party's aggregate liability exceed the fees paid in the {n} months preceding the claim.",
+    "Each party shall indemnify and hold harmless the other party from third party claims arising from its breach.",
+    "The Receiving Party shall hold all Confidential Information in strict confidence for {n} years.",
+    "Payment terms are net {n} days from the date of invoice; late payments bear interest at 1.5% per month.",
+    "This Agreement shall be governed by the laws of the State of {state}.",
+    "The courts located in {state} shall have exclusive jurisdiction over any dispute arising hereunder.",
+    "Any breach of the non-compete covenant shall result in a penalty of ${n},000.",
+    "All notices shall be in writing and delivered to the addresses set forth above; the notice period is {n} days.",
+    "The Supplier shall deliver the Products in accordance with the delivery schedule in Exhibit {n}.",
+    "Neither party may assign this Agreement without the prior written consent of the other party.",
+]
+STATES = ["New York", "Delaware", "California", "Texas", "Illinois"]
+CORPUS_QUESTIONS = [
+    "What is the termination notice period?",
+    "What liability caps apply?",
+    "Are there automatic renewal terms?",
+    "Which jurisdiction applies?",
+    "What are the payment terms?",
+]
+
+
+def make_contract(rng, clauses=8):
+    parts = [f"MASTER SERVICES AGREEMENT between Party {rng.randint(1, 999)} and Party {rng.randint(1, 999)}."]
+    for i, c in enumerate(rng.sample(CLAUSES, clauses)):
+        parts.append(f"{i + 1}. " + c.format(n=rng.randint(5, 90), state=rng.choice(STATES)))
+    return "\n\n".join(parts)
+
+
+def make_pdf(text):
+    """Smallest valid single-page PDF carrying `text` (one line per paragraph)."""
+    lines = [l.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for l in text.split("\n") if l]
+    stream = "BT /F1 9 Tf 36 800 Td 12 TL " + " ".join(f"({l[:110]}) '" for l in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+        "/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+    ]
+    out = "%PDF-1.4\n"
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def offline_env(workdir):
+    return {
+        "LEGALLENS_OUTPUT_DIR": workdir,
+        # Empty legacy text dir: get_store() would otherwise import the real corpus
+        "LEGALLENS_TXT_DIR": os.path.join(workdir, "txt"),
+        "LEGALLENS_EMBED_BACKEND": "hashing",
+    }
+
+
+def seed_corpus(docs, shards, seed):
+    """Fill the (scratch) document store and publish an index version. Call after offline_env is applied."""
+    from ai.doc_store import get_store
+    from ai.versions import build_version
+
+    rng = random.Random(seed)
+    store = get_store()
+    for i in range(docs):
+        store.put(f"seed_{i:05d}", make_contract(rng))
+    build_version(shards)
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation '{name}' (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ---------- operations ----------
+# Each returns (endpoint label, httpx response)
+
+async def op_qa_corpus(client, state, rng):
+    q = rng.choice(CORPUS_QUESTIONS)
+    return "qa_corpus", await client.post("/qa", data={"question": q})
+
+
+async def op_qa_doc(client, state, rng):
+    doc_id, _ = rng.choice(state["docs"])
+    q = rng.choice(["What is the notice period?", "Who has liability?", "What are the payment terms?"])
+    return "qa_doc", await client.post("/qa", data={"question": q, "doc_id": doc_id})
+
+
+async def op_qa_suggested(client, state, rng):
+    doc_id, queries = rng.choice(state["docs"])
+    q = rng.choice(queries) if queries else "What are the key obligations and risks?"
+    return "qa_suggested", await client.post("/qa", data={"question": q, "doc_id": doc_id})
+
+
+async def op_risk(client, state, rng):
+    doc_id, _ = rng.choice(state["docs"])
+    return "risk", await client.post("/risk", data={"doc_id": doc_id})
+
+
+async def op_summarize(client, state, rng):
+    doc_id, _ = rng.choice(state["docs"])
+    return "summarize", await client.post("/summarize", data={"doc_id": doc_id})
+
+
+async def op_upload_text(client, state, rng):
+    resp = await client.post("/upload_text", data={"text": make_contract(rng)})
+    _remember_upload(state, resp)
+    return "upload_text", resp
+
+
+async def op_upload_pdf(client, state, rng):
+    files = {"file": ("contract.pdf", make_pdf(make_contract(rng)), "application/pdf")}
+    resp = await client.post("/upload", files=files)
+    _remember_upload(state, resp)
+    return "upload_pdf", resp
+
+
+def _remember_upload(state, resp):
+    if resp.status_code == 200:
+        body = resp.json()
+        state["docs"].append((body["doc_id"], body.get("queries", [])))
+
+
+OPERATIONS = {
+    "qa_corpus": op_qa_corpus,
+    "qa_doc": op_qa_doc,
+    "qa_suggested": op_qa_suggested,
+    "risk": op_risk,
+    "summarize": op_summarize,
+    "upload_text": op_upload_text,
+    "upload_pdf": op_upload_pdf,
+}
+
+
+# ---------- driver ----------
+
+class Recorder:
+
+    def __init__(self):
+        self.samples = {}      # endpoint -> list of (latency_s, status)
+
+    def add(self, endpoint, latency, status):
+        self.samples.setdefault(endpoint, []).append((latency, status))
+
+    @staticmethod
+    def _pct(sorted_vals, p):
+        if not sorted_vals:
+            return None
+        # Nearest-rank percentile
+        k = min(len(sorted_vals) - 1, max(0, math.ceil(p / 100 * len(sorted_vals)) - 1))
+        return round(sorted_vals[k] * 1000, 2)
+
+    def _summary(self, samples, elapsed):
+        ok = sorted(l for l, s in samples if 200 <= s < 400)
+        return {
+            "requests": len(samples),
+            "ok": len(ok),
+            "rejected_429": sum(1 for _, s in samples if s == 429),
+            "errors": sum(1 for _, s in samples if s >= 400 and s != 429),
+            "error_rate": round(sum(1 for _, s in samples if s >= 400) / len(samples), 4) if samples else 0.0,
+            "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+            "p50_ms": self._pct(ok, 50),
+            "p95_ms": self._pct(ok, 95),
+            "p99_ms": self._pct(ok, 99),
+            "max_ms": round(ok[-1] * 1000, 2) if ok else None,
+        }
+
+    def report(self, elapsed):
+        everything = [x for v in self.samples.values() for x in v]
+        return {
+            "overall": self._summary(everything, elapsed),
+            "endpoints": {k: self._summary(v, elapsed) for k, v in sorted(self.samples.items())},
+        }
+
+
+async def _issue(client, state, rng, name, recorder, scheduled):
+    try:
+        endpoint, resp = await OPERATIONS[name](client, state, rng)
+        status = resp.status_code
+    except Exception as e:
+        endpoint, status = name, 599
+        state["exceptions"].append(f"{name}: {e!r}")
+    # Measured from when the request was due, so client-side queueing counts (no coordinated omission)
+    recorder.add(endpoint, time.perf_counter() - scheduled, status)
+
+
+async def drive(client, mix, duration, concurrency, rate, seed, warmup_docs):
+    rng = random.Random(seed)
+    state = {"docs": [], "exceptions": []}
+    for _ in range(warmup_docs):
+        await op_upload_text(client, state, rng)
+    if not state["docs"]:
+        raise SystemExit("Warm-up uploads failed; is the API reachable?")
+
+    names, weights = zip(*mix.items())
+    recorder = Recorder()
+    gate = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def one(scheduled):
+        async with gate:
+            await _issue(client, state, rng, rng.choices(names, weights)[0], recorder, scheduled)
+
+    if rate:
+        # Open loop: Poisson arrivals, capped at `concurrency` in flight
+        tasks = []
+        next_at = started
+        while next_at < deadline:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            tasks.append(asyncio.create_task(one(next_at)))
+            next_at += rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+    else:
+        # Closed loop: `concurrency` clients issuing back to back
+        async def worker():
+            while time.perf_counter() < deadline:
+                await one(time.perf_counter())
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    elapsed = time.perf_counter() - started
+    result = recorder.report(elapsed)
+    result["elapsed_s"] = round(elapsed, 2)
+    result["sample_exceptions"] = state["exceptions"][:10]
+    return result
+
+
+def _peak_rss_mb(pid=None):
+    if pid is None:
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1)
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+async def _run_in_process(args):
+    import httpx
+    from api.app import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120) as client:
+            result = await drive(client, parse_mix(args.mix), args.duration, args.concurrency,
+                                 args.rate, args.seed, args.warmup_docs)
+            result["scheduler"] = (await client.get("/admin/scheduler")).json()
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+async def _run_remote(args, url, pid):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+        result = await drive(client, parse_mix(args.mix), args.duration, args.concurrency,
+                             args.rate, args.seed, args.warmup_docs)
+        try:
+            result["scheduler"] = (await client.get("/admin/scheduler")).json()
+        except Exception:
+            pass
+    result["peak_rss_mb"] = _peak_rss_mb(pid)
+    return result
+
+
+def _wait_until_up(url, proc, timeout=120):
+    import httpx
+
+    stop = time.time() + timeout
+    while time.time() < stop:
+        if proc.poll() is not None:
+            raise SystemExit("uvicorn exited during startup")
+        try:
+            httpx.get(url + "/admin/version", timeout=2)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise SystemExit("uvicorn did not come up in time")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation=weight,... (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of measured load")
+    parser.add_argument("--concurrency", type=int, default=8, help="max requests in flight")
+    parser.add_argument("--rate", type=float, default=0.0, help="open-loop arrivals per second (0 = closed loop)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--docs", type=int, default=200, help="synthetic contracts in the seeded corpus")
+    parser.add_argument("--shards", type=int, default=2, help="index shards for the seeded corpus")
+    parser.add_argument("--warmup-docs", type=int, default=8, help="uploads before measuring, used by doc-scoped ops")
+    parser.add_argument("--url", help="drive an already running server instead of the in-process app")
+    parser.add_argument("--server-pid", type=int, help="pid of --url server, for peak RSS")
+    parser.add_argument("--spawn-server", action="store_true", help="start a local uvicorn on --port")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workdir", help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--out", default="loadtest.json", help="JSON report path")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        result = asyncio.run(_run_remote(args, args.url.rstrip("/"), args.server_pid))
+        mode = "remote"
+    else:
+        workdir = args.workdir or tempfile.mkdtemp(prefix="legallens-load-")
+        env = offline_env(workdir)
+        # Must be in place before ai.config is imported
+        os.environ.update(env)
+        seed_corpus(args.docs, args.shards, args.seed)
+
+        if args.spawn_server:
+            url = f"http://127.0.0.1:{args.port}"
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "api.app:app", "--port", str(args.port), "--log-level", "warning"],
+                env={**os.environ, **env},
+            )
+            try:
+                _wait_until_up(url, proc)
+                result = asyncio.run(_run_remote(args, url, proc.pid))
+            finally:
+                proc.terminate()
+                proc.wait()
+            mode = "uvicorn"
+        else:
+            result = asyncio.run(_run_in_process(args))
+            mode = "in-process"
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mode": mode,
+        "config": {
+            "mix": parse_mix(args.mix),
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "rate_rps": args.rate or None,
+            "seed": args.seed,
+            "docs": args.docs,
+            "shards": args.shards,
+        },
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count(), "platform": platform.platform()},
+        **result,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'endpoint':<14}{'reqs':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'err%':>7}{'429':>6}")
+    for name, s in list(report["endpoints"].items()) + [("ALL", report["overall"])]:
+        print(f"{name:<14}{s['requests']:>7}{s['throughput_rps'] or 0:>8}{s['p50_ms'] or '-':>9}"
+              f"{s['p95_ms'] or '-':>9}{s['p99_ms'] or '-':>9}{s['error_rate'] * 100:>7.1f}{s['rejected_429']:>6}")
+    print(f"peak RSS: {report['peak_rss_mb']} MB  →  {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import math
+import heapq
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+from ai.config import SCHED_LIMITS, SCHED_DEADLINE_S, SCHED_BULK_QUEUE_SHARE
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+_RANK = {INTERACTIVE: 0, BULK: 1}
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint in seconds."""
+
+    def __init__(self, resource, retry_after):
+        super().__init__(f"{resource} is overloaded, retry in {retry_after}s")
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+class ResourceLimiter:
+    """
+    Bounded, priority-ordered admission for one resource.
+
+    At most `concurrency` requests hold the resource; up to `max_queue`
+    wait for it, interactive ahead of bulk. A request is rejected up front
+    when the queue is full or when the estimated wait (from a running
+    average of hold times) already exceeds its deadline, and is dropped
+    from the queue if the deadline passes while waiting.
+    """
+
+    def __init__(self, name, concurrency, max_queue, bulk_share=SCHED_BULK_QUEUE_SHARE):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_bulk_queue = max(1, int(max_queue * bulk_share))
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []          # heap of (rank, seq)
+        self._bulk_waiting = 0
+        self._seq = itertools.count()
+        self._avg_hold_s = 0.5
+        self.rejected = 0
+
+    def _estimated_wait(self, ahead):
+        return (ahead + 1) * self._avg_hold_s / self.concurrency
+
+    def _reject(self, ahead):
+        self.rejected += 1
+        return Overloaded(self.name, max(1, math.ceil(self._estimated_wait(ahead))))
+
+    def _admission_error(self, priority, deadline_s):
+        # Caller holds self._cond. Returns the Overloaded to raise, or None to queue.
+        ahead = sum(1 for r, _ in self._waiting if r <= _RANK[priority])
+        if len(self._waiting) >= self.max_queue:
+            return self._reject(len(self._waiting))
+        if priority == BULK and self._bulk_waiting >= self.max_bulk_queue:
+            return self._reject(len(self._waiting))
+        if self._estimated_wait(ahead) > deadline_s:
+            return self._reject(ahead)
+        return None
+
+    def check(self, priority=INTERACTIVE, deadline_s=None):
+        """Raise Overloaded if acquire() would reject right now, without taking a slot."""
+        if deadline_s is None:
+            deadline_s = SCHED_DEADLINE_S[priority]
+        with self._cond:
+            if self._active < self.concurrency and not self._waiting:
+                return
+            error = self._admission_error(priority, deadline_s)
+        if error is not None:
+            raise error
+
+    def acquire(self, priority=INTERACTIVE, deadline_s=None):
+        rank = _RANK[priority]
+        if deadline_s is None:
+            deadline_s = SCHED_DEADLINE_S[priority]
+
+        with self._cond:
+            if self._active < self.concurrency and not self._waiting:
+                self._active += 1
+                return
+
+            ahead = sum(1 for r, _ in self._waiting if r <= rank)
+            error = self._admission_error(priority, deadline_s)
+            if error is not None:
+                raise error
+
+            ticket = (rank, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            if priority == BULK:
+                self._bulk_waiting += 1
+            give_up = time.monotonic() + deadline_s
+            try:
+                while not (self._waiting[0] == ticket and self._active < self.concurrency):
+                    remaining = give_up - time.monotonic()
+                    if remaining <= 0:
+                        raise self._reject(ahead)
+                    self._cond.wait(remaining)
+                heapq.heappop(self._waiting)
+                self._active += 1
+            except Overloaded:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                raise
+            finally:
+                if priority == BULK:
+                    self._bulk_waiting -= 1
+                # The new head of the queue may now be able to run
+                self._cond.notify_all()
+
+    def release(self, held_s):
+        with self._cond:
+            self._active -= 1
+            self._avg_hold_s = 0.8 * self._avg_hold_s + 0.2 * held_s
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": len(self._waiting),
+                "avg_hold_s": round(self._avg_hold_s, 3),
+                "rejected": self.rejected,
+            }
+
+
+class Scheduler:
+    def __init__(self, limits=SCHED_LIMITS):
+        self.limiters = {
+            name: ResourceLimiter(name, cfg["concurrency"], cfg["max_queue"])
+            for name, cfg in limits.items()
+        }
+
+    @contextmanager
+    def slot(self, resource, priority=INTERACTIVE, deadline_s=None):
+        limiter = self.limiters[resource]
+        limiter.acquire(priority, deadline_s)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            limiter.release(time.monotonic() - started)
+
+    def check(self, resource, priority=INTERACTIVE, deadline_s=None):
+        self.limiters[resource].check(priority, deadline_s)
+
+    def capacity(self):
+        """Most requests that can be running or queued at once across all resources."""
+        return sum(l.concurrency + l.max_queue for l in self.limiters.values())
+
+    def stats(self):
+        return {name: l.stats() for name, l in self.limiters.items()}
+
+
+SCHEDULER = Scheduler()
@@ -1,5 +1,5 @@
 // frontend/src/App.jsx
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import axios from "axios";
 const API = "http://localhost:8000";
 
@@ -16,6 +16,20 @@ export default function App() {
   const [tab, setTab] = useState("summary");
   const summaryLines = (summary || "").split("\n").filter((l) => l.trim());
 
+  // Tell the backend to stop precomputing answers for a document we left
+  const abandonDoc = (id) => {
+    if (!id) return;
+    const form = new URLSearchParams();
+    form.append("doc_id", id);
+    navigator.sendBeacon(`${API}/abandon`, form);
+  };
+
+  useEffect(() => {
+    const onUnload = () => abandonDoc(docId);
+    window.addEventListener("beforeunload", onUnload);
+    return () => window.removeEventListener("beforeunload", onUnload);
+  }, [docId]);
+
   // 1) Upload / paste flows
   const submitPastedText = async () => {
     if (!pasteText.trim()) return alert("Paste some text first");
@@ -24,6 +38,7 @@ export default function App() {
       const form = new URLSearchParams();
       form.append("text", pasteText);
       const res = await axios.post(`${API}/upload_text`, form);
+      abandonDoc(docId);
       setDocId(res.data.doc_id);
       await loadAfterIndex(res.data.doc_id);
     } catch (err) {
@@ -42,8 +57,13 @@ export default function App() {
       const fd = new FormData();
       fd.append("file", file);
       const res = await axios.post(`${API}/upload`, fd, {
-        headers: { "Content-Type": "multipart/form-data" },
+        headers: {
+          "Content-Type": "multipart/form-data",
+          // Lets the API refuse an overloaded PDF upload before reading the body
+          "X-Upload-Type": file.name.toLowerCase().endsWith(".pdf") ? "pdf" : "txt",
+        },
       });
+      abandonDoc(docId);
       setDocId(res.data.doc_id);
       await loadAfterIndex(res.data.doc_id);
     } catch (err) {